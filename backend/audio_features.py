@@ -0,0 +1,145 @@
+import os
+import asyncio
+import logging
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Same values as whisper.audio, duplicated so importing this module does not pull in torch
+SAMPLE_RATE = 16000
+CHUNK_LENGTH = 30
+N_SAMPLES = CHUNK_LENGTH * SAMPLE_RATE
+
+# Mel bin counts to precompute at upload time, e.g. "80,128" (empty disables the mel cache)
+PRECOMPUTE_MEL_BINS = [int(n) for n in os.environ.get("PRECOMPUTE_MEL_BINS", "").split(",") if n.strip()]
+
+
+def pcm_path(audio_path):
+    """Path of the decoded 16 kHz float32 PCM stored next to an audio file"""
+    return os.path.splitext(audio_path)[0] + ".pcm.npy"
+
+
+def mel_path(audio_path, n_mels):
+    """Path of the cached 30-second log-mel window stored next to an audio file"""
+    return os.path.splitext(audio_path)[0] + f".mel{n_mels}.npy"
+
+
+def prepare_audio(audio_path, mel_bins=None):
+    """
+    Decode an uploaded file once to 16 kHz float32 PCM and cache it as .npy,
+    optionally with the log-mel features of its first 30-second window.
+
+    Args:
+        audio_path: Path to the uploaded audio file
+        mel_bins: Mel bin counts to precompute (defaults to PRECOMPUTE_MEL_BINS)
+
+    Returns:
+        Path to the PCM file
+    """
+    import whisper
+
+    return save_pcm(audio_path, whisper.load_audio(audio_path), mel_bins)
+
+
+def save_pcm(audio_path, audio, mel_bins=None):
+    """Store decoded PCM (and optionally mel windows) next to an audio file; returns the PCM path"""
+    path = pcm_path(audio_path)
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, audio)
+    os.replace(tmp_path, path)
+    logger.info(f"Decoded {len(audio) / SAMPLE_RATE:.1f}s of audio to {path}")
+
+    for n_mels in (PRECOMPUTE_MEL_BINS if mel_bins is None else mel_bins):
+        # Only single-window clips are decoded straight from a cached mel
+        if len(audio) > N_SAMPLES:
+            break
+        import whisper
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=n_mels)
+        np.save(mel_path(audio_path, n_mels), mel.numpy())
+    return path
+
+
+class StreamingPCMDecoder:
+    """
+    Decodes audio to 16 kHz PCM with an ffmpeg subprocess fed from an upload stream,
+    so decoding overlaps with the bytes still arriving instead of starting afterwards.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.stdout_task = None
+        self.stderr_task = None
+        self.failed = False
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-nostdin", "-threads", "0", "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+            "-loglevel", "error", "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        # Drain both pipes concurrently so ffmpeg never blocks on a full buffer
+        self.stdout_task = asyncio.create_task(self.process.stdout.read())
+        self.stderr_task = asyncio.create_task(self.process.stderr.read())
+
+    async def feed(self, chunk):
+        if self.failed:
+            return
+        try:
+            self.process.stdin.write(chunk)
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg gave up on the input; the caller falls back to decoding the file
+            self.failed = True
+
+    async def finish(self, audio_path):
+        """Close the input, wait for ffmpeg and save the PCM next to audio_path"""
+        if not self.failed:
+            self.process.stdin.close()
+        raw = await self.stdout_task
+        errors = await self.stderr_task
+        code = await self.process.wait()
+        if self.failed or code != 0:
+            raise RuntimeError(f"Streaming decode failed: {errors.decode(errors='ignore').strip()}")
+
+        audio = np.frombuffer(raw, np.int16).astype(np.float32) / 32768.0
+        return await asyncio.to_thread(save_pcm, audio_path, audio)
+
+    def abort(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+
+
+def pcm_duration(audio_path):
+    """Duration in seconds of an audio file's cached PCM, or None if it was not decoded"""
+    path = pcm_path(audio_path)
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r").shape[0] / SAMPLE_RATE
+
+
+def load_pcm(audio_path):
+    """
+    Load the PCM for an audio file, memory-mapped from the upload-time cache when
+    present (copy-on-write, so no bytes are copied unless written), or decoded with ffmpeg.
+    """
+    path = pcm_path(audio_path)
+    if os.path.exists(path):
+        return np.load(path, mmap_mode="c")
+
+    import whisper
+    return whisper.load_audio(audio_path)
+
+
+def load_mel(audio_path, n_mels):
+    """Return the cached (n_mels, 3000) log-mel tensor for an audio file, or None"""
+    import torch
+
+    path = mel_path(audio_path, n_mels)
+    if not os.path.exists(path):
+        return None
+    return torch.from_numpy(np.load(path, mmap_mode="c"))
@@ -0,0 +1,181 @@
+"""
+Batch re-transcription of whole storage folders.
+
+Usage (from the repository root, like the app itself):
+    python backend/batch_transcribe.py --date 2025-05-10 --model large-v3
+    python backend/batch_transcribe.py --sessions 2025-05-10/101530 2025-05-10/114502 --hf
+    python backend/batch_transcribe.py --date 2025-05-10 --backend auto --model small
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+from transcription_cache import audio_hash
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+META_FILENAME = "transcription.json"
+
+
+def transcription_settings(language, model_size, use_hf_model, use_vad=False, long_audio=False, precision="auto", assisted=False, backend=None):
+    """The settings that determine a transcription's output, as stored in transcription.json"""
+    backend = backend or ("hf" if use_hf_model else "whisper")
+    return {
+        "language": language.lower(),
+        "backend": backend,
+        "model": None if backend == "hf" else model_size.lower(),
+        "use_vad": use_vad,
+        "long_audio": long_audio,
+        "precision": precision,
+        "assisted": assisted,
+    }
+
+
+def write_transcription_meta(transcription_path, settings, audio_sha256):
+    """Record which settings and audio produced a transcription.txt"""
+    meta_path = os.path.join(os.path.dirname(transcription_path), META_FILENAME)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({**settings, "audio_sha256": audio_sha256}, f, ensure_ascii=False)
+
+
+def is_current(session_dir, settings):
+    """Whether the session's transcription.txt was produced from its current audio with these settings"""
+    transcription_path = os.path.join(session_dir, "transcription.txt")
+    meta_path = os.path.join(session_dir, META_FILENAME)
+    if not os.path.exists(transcription_path) or not os.path.exists(meta_path):
+        return False
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    # Routed ("auto") runs accept whichever engine and model the router picked
+    skip = {"backend", "model"} if settings["backend"] == "auto" else set()
+    if any(meta.get(k) != v for k, v in settings.items() if k not in skip):
+        return False
+    return meta.get("audio_sha256") == audio_hash(os.path.join(session_dir, "audio.webm"))
+
+
+def find_sessions(storage_dir, date_folder=None, sessions=None, index=None):
+    """
+    List the sessions to process.
+
+    Args:
+        storage_dir: The STORAGE_DIR root
+        date_folder: A YYYY-MM-DD folder whose sessions are all included
+        sessions: Explicit "YYYY-MM-DD/HHMMSS" session names
+        index: SessionIndex to query for the date folder instead of listing the directory
+
+    Returns:
+        List of (date_folder, session_folder) that have an audio.webm, in order
+    """
+    found = []
+    if date_folder and index is not None:
+        found.extend(index.date_sessions(date_folder))
+    elif date_folder:
+        date_dir = os.path.join(storage_dir, date_folder)
+        if os.path.isdir(date_dir):
+            for name in sorted(os.listdir(date_dir)):
+                found.append((date_folder, name))
+    for session in sessions or []:
+        date, _, name = session.strip("/").partition("/")
+        found.append((date, name))
+
+    result = []
+    for date, name in dict.fromkeys(found):
+        if os.path.exists(os.path.join(storage_dir, date, name, "audio.webm")):
+            result.append((date, name))
+    return result
+
+
+async def run_batch(storage_dir, sessions, settings, submit, concurrency=2, force=False):
+    """
+    Transcribe sessions with bounded concurrency, yielding a progress event per session.
+
+    Args:
+        storage_dir: The STORAGE_DIR root
+        sessions: List of (date_folder, session_folder)
+        settings: Output of transcription_settings()
+        submit: Coroutine (audio_path, transcription_path) -> result dict that runs one transcription
+        concurrency: Maximum sessions in flight at once
+        force: Re-transcribe even when transcription.txt is current
+
+    Yields:
+        Progress dicts: {"type": "skipped" | "done" | "error", ...} then a final {"type": "summary"}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"done": 0, "skipped": 0, "error": 0}
+
+    async def process(date, name):
+        session_dir = os.path.join(storage_dir, date, name)
+        event = {"date_folder": date, "session_folder": name}
+        if not force and await asyncio.to_thread(is_current, session_dir, settings):
+            return {**event, "type": "skipped"}
+        async with semaphore:
+            try:
+                result = await submit(os.path.join(session_dir, "audio.webm"), os.path.join(session_dir, "transcription.txt"))
+                return {**event, "type": "done", "characters": len(result["transcription"]), "cached": result.get("cached", False)}
+            except Exception as e:
+                logger.error(f"Batch transcription of {date}/{name} failed: {str(e)}")
+                return {**event, "type": "error", "detail": str(e)}
+
+    tasks = [asyncio.create_task(process(date, name)) for date, name in sessions]
+    for index, task in enumerate(asyncio.as_completed(tasks), start=1):
+        event = await task
+        counts[event["type"]] += 1
+        yield {**event, "completed": index, "total": len(tasks)}
+    yield {"type": "summary", "total": len(tasks), **counts}
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Re-transcribe stored sessions in bulk")
+    parser.add_argument("--date", help="Date folder (YYYY-MM-DD) to process")
+    parser.add_argument("--sessions", nargs="*", default=[], help="Explicit YYYY-MM-DD/HHMMSS sessions")
+    parser.add_argument("--language", default="tiếng việt")
+    parser.add_argument("--model", default="turbo", help="Whisper model size")
+    parser.add_argument("--hf", action="store_true", help="Use the HuggingFace backend")
+    parser.add_argument("--backend", help="Registered engine to use, or auto to route each session to the fastest one")
+    parser.add_argument("--vad", action="store_true", help="Skip silence before decoding")
+    parser.add_argument("--long-audio", action="store_true", help="Split long recordings across processes")
+    parser.add_argument("--precision", default="auto")
+    parser.add_argument("--assisted", action="store_true", help="Speculative decoding with a draft model")
+    parser.add_argument("--concurrency", type=int, default=2, help="Sessions queued on the job scheduler at once")
+    parser.add_argument("--force", action="store_true", help="Re-transcribe sessions that are already current")
+    args = parser.parse_args()
+
+    if not args.date and not args.sessions:
+        parser.error("Pass --date or --sessions")
+
+    # Reuse the API's transcription path (cache, batching, pools) without starting the server
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from main import submit_batch_job, request_backend, STORAGE_DIR, session_index
+    from job_queue import job_scheduler
+
+    requested_backend = request_backend(args.hf, args.backend)
+    settings = transcription_settings(args.language, args.model, args.hf, args.vad, args.long_audio, args.precision, args.assisted, requested_backend)
+    session_index.backfill()
+    sessions = find_sessions(STORAGE_DIR, args.date, args.sessions, session_index)
+
+    async def submit(audio_path, transcription_path):
+        # Same path as /api/transcribe/batch: batch priority and admission control on the job scheduler
+        return await submit_batch_job(
+            audio_path, transcription_path, args.language, args.model, args.hf,
+            args.vad, args.long_audio, args.precision, args.assisted, requested_backend,
+        )
+
+    async def main():
+        async for event in run_batch(STORAGE_DIR, sessions, settings, submit, args.concurrency, args.force):
+            print(json.dumps(event, ensure_ascii=False), flush=True)
+
+    try:
+        asyncio.run(main())
+    finally:
+        job_scheduler.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,176 @@
+import os
+import logging
+import time
+from threading import Condition, Thread
+from concurrent.futures import Future
+from audio_features import SAMPLE_RATE
+from job_queue import TRANSCRIBE_WORKERS, TRANSCRIBE_EXECUTOR
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Batching policy, overridable from the environment. "auto" only batches when several
+# transcription threads can submit clips at once; with one worker (or worker processes,
+# which each have their own batcher) every clip would just wait max_wait_ms alone.
+WHISPER_BATCHING = os.environ.get("WHISPER_BATCHING", "auto")
+BATCHING_ENABLED = WHISPER_BATCHING == "1" or (
+    WHISPER_BATCHING == "auto" and TRANSCRIBE_EXECUTOR == "thread" and TRANSCRIBE_WORKERS > 1
+)
+BATCH_MAX_SIZE = int(os.environ.get("WHISPER_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("WHISPER_BATCH_MAX_WAIT_MS", "50"))
+
+
+# Quality checks and temperature fallback, as in model.transcribe()'s defaults
+TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+FALLBACK_BEST_OF = 5
+
+
+def needs_fallback(result):
+    """Whether a greedy result looks degenerate and should be decoded again at a higher temperature"""
+    if result.no_speech_prob > NO_SPEECH_THRESHOLD:
+        # Silence: a low logprob is expected, not a decoding failure
+        return False
+    return result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD
+
+
+def is_silence(result):
+    """model.transcribe() drops windows that are probably silence and decoded with low confidence"""
+    return result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD
+
+
+def segments_from_tokens(tokenizer, tokens, duration):
+    """
+    Split a decoded token sequence into timed segments at its timestamp tokens,
+    the way model.transcribe() does for a single 30-second window.
+    """
+    timestamp_begin = tokenizer.timestamp_begin
+    segments = []
+    start, text_tokens = 0.0, []
+    for token in tokens:
+        if token < timestamp_begin:
+            text_tokens.append(token)
+            continue
+        time_s = (token - timestamp_begin) * 0.02
+        if text_tokens:
+            segments.append({"start": round(start, 2), "end": round(time_s, 2), "text": tokenizer.decode(text_tokens).strip()})
+            text_tokens = []
+        start = time_s
+    if text_tokens:
+        segments.append({"start": round(start, 2), "end": round(duration, 2), "text": tokenizer.decode(text_tokens).strip()})
+    return segments
+
+
+class WhisperBatcher:
+    """
+    Groups concurrent short-clip requests that share a model size and language
+    into a single batched whisper.decode() call over their 30-second mel windows.
+    """
+
+    def __init__(self, pool, max_batch_size=8, max_wait_ms=50):
+        self.pool = pool
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.queues = {}  # (model_size, language_code, precision) -> list of (mel, duration, future)
+        self.workers = {}
+        self.cond = Condition()
+
+    def transcribe(self, audio, model_size, language_code, mel=None, precision="auto"):
+        """
+        Transcribe a clip of at most 30 seconds, batched with concurrent requests.
+
+        Args:
+            audio: 16 kHz float32 audio samples (whisper.load_audio output)
+            model_size: Size of the Whisper model to use
+            language_code: Whisper language code ("en", "vi", ...)
+            mel: Precomputed (n_mels, 3000) log-mel window, if cached at upload time
+            precision: Model precision variant from the pool
+
+        Returns:
+            Tuple of (text, segments with timestamps in seconds)
+        """
+        import whisper
+
+        if mel is None:
+            model = self.pool.get_model(model_size, precision)
+            # Compute the mel on the caller's thread so preprocessing runs in parallel
+            mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=model.dims.n_mels)
+
+        future = Future()
+        key = (model_size, language_code, precision)
+        with self.cond:
+            self.queues.setdefault(key, []).append((mel, len(audio) / SAMPLE_RATE, future))
+            if key not in self.workers:
+                worker = Thread(target=self._run, args=(key,), name=f"batcher-{model_size}-{language_code}-{precision}", daemon=True)
+                self.workers[key] = worker
+                worker.start()
+            self.cond.notify_all()
+        return future.result()
+
+    def _next_batch(self, key):
+        with self.cond:
+            queue = self.queues[key]
+            while not queue:
+                self.cond.wait()
+            # Give concurrent requests a short window to join the batch
+            deadline = time.monotonic() + self.max_wait
+            while len(queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch = queue[:self.max_batch_size]
+            del queue[:self.max_batch_size]
+            return batch
+
+    def _run(self, key):
+        import torch
+        import whisper
+
+        model_size, language_code, precision = key
+        while True:
+            batch = self._next_batch(key)
+            try:
+                model = self.pool.get_model(model_size, precision)
+                mels = torch.stack([mel for mel, _, _ in batch]).to(model.device)
+                options = whisper.DecodingOptions(
+                    language=language_code,
+                    task="transcribe",
+                    fp16=model.device.type == "cuda" and precision == "auto",
+                )
+                tokenizer = whisper.tokenizer.get_tokenizer(
+                    model.is_multilingual, num_languages=model.num_languages, language=language_code, task="transcribe"
+                )
+                # Other batchers (languages), streams and scheduler jobs may share this model
+                with self.pool.inference_lock(model_size, precision):
+                    start_time = time.time()
+                    results = whisper.decode(model, mels, options)
+                    logger.info(f"Batched decode of {len(batch)} clips on {model_size} took {time.time() - start_time:.3f}s")
+                    results = [
+                        self._decode_with_fallback(model, mel, options) if needs_fallback(result) else result
+                        for mel, result in zip(mels, results)
+                    ]
+                for (_, duration, future), result in zip(batch, results):
+                    if is_silence(result):
+                        future.set_result(("", []))
+                    else:
+                        future.set_result((result.text.strip(), segments_from_tokens(tokenizer, result.tokens, duration)))
+            except Exception as e:
+                logger.error(f"Batched decode error: {str(e)}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _decode_with_fallback(self, model, mel, options):
+        """Re-decode one clip at increasing temperatures until it passes the quality checks"""
+        import dataclasses
+        import whisper
+
+        for temperature in TEMPERATURES[1:]:
+            result = whisper.decode(model, mel, dataclasses.replace(options, temperature=temperature, best_of=FALLBACK_BEST_OF))
+            if not needs_fallback(result):
+                break
+        return result
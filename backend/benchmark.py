@@ -0,0 +1,327 @@
+"""
+Benchmark harness for the transcription stack.
+
+Measures API import/startup time, model load time per pool entry, ffmpeg decode,
+mel computation, encoder and decoder time, and end-to-end latency through the
+FastAPI app under concurrent clients. Results are written as JSON so runs can be compared.
+
+Usage (from the repository root, like the app itself):
+    python backend/benchmark.py --models tiny base --clients 4 --requests 20 --output bench.json
+    python backend/benchmark.py --audio fixtures/sample.webm --skip-e2e
+    python backend/benchmark.py --startup-only --check-startup   # CI gate on API startup time
+"""
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import wave
+import socket
+import platform
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+# Startup budget for importing the API module (no model or torch initialization)
+STARTUP_TARGET_SECONDS = float(os.environ.get("STARTUP_TARGET_SECONDS", "3.0"))
+HEAVY_MODULES = ["torch", "whisper", "transformers"]
+
+
+def percentiles(samples):
+    """Summary statistics (seconds) for a list of timings"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+def timed(fn, repeat=1):
+    """Run fn repeat times and return (last result, list of durations)"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start)
+    return result, durations
+
+
+def synthetic_wav(path, seconds=10.0):
+    """Write a speech-like test signal: voiced harmonic bursts separated by pauses"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    voiced = sum(np.sin(2 * np.pi * k * np.cumsum(pitch) / SAMPLE_RATE) / k for k in range(1, 6))
+    envelope = (np.sin(2 * np.pi * 0.4 * t) > -0.3).astype(np.float32)
+    noise = np.random.default_rng(0).normal(0, 0.005, len(t))
+    signal = 0.2 * voiced * envelope + noise
+    pcm = (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+    return path
+
+
+def bench_startup(target_seconds):
+    """Time a cold `import main` in a fresh interpreter and list heavy modules it pulled in"""
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    script = (
+        "import sys, time, json\n"
+        f"sys.path.insert(0, {backend_dir!r})\n"
+        "start = time.perf_counter()\n"
+        "import main\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(json.dumps({{'seconds': elapsed, 'heavy': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    # The app serves ./frontend, so import it from the repository root like `python backend/main.py`
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=os.path.dirname(backend_dir),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return {
+        "import_seconds": result["seconds"],
+        "heavy_modules_loaded": result["heavy"],
+        "target_seconds": target_seconds,
+        "within_target": result["seconds"] <= target_seconds and not result["heavy"],
+    }
+
+
+def bench_stages(audio_path, model_sizes, repeat, use_hf):
+    """Per-stage timings for each model"""
+    import whisper
+    from transcription import model_pool
+    from hf_transcription import hf_model_pool, DEFAULT_MODEL_ID
+    from hf_tuning import pipeline_settings
+
+    results = {}
+    audio, decode_times = timed(lambda: whisper.load_audio(audio_path), repeat)
+    results["ffmpeg_decode"] = percentiles(decode_times)
+    results["audio_seconds"] = len(audio) / SAMPLE_RATE
+
+    for model_size in model_sizes:
+        model, load_times = timed(lambda: model_pool.get_model(model_size))
+        entry = {"load": load_times[0]}
+
+        window = whisper.pad_or_trim(audio)
+        mel, mel_times = timed(lambda: whisper.log_mel_spectrogram(window, n_mels=model.dims.n_mels).to(model.device), repeat)
+        entry["mel"] = percentiles(mel_times)
+
+        fp16 = model.device.type == "cuda"
+        with_dtype = mel.half() if fp16 else mel
+        features, encoder_times = timed(lambda: model.embed_audio(with_dtype.unsqueeze(0)), repeat)
+        entry["encoder"] = percentiles(encoder_times)
+
+        # Passing encoder output makes whisper.decode skip the encoder
+        options = whisper.DecodingOptions(language="en", fp16=fp16, without_timestamps=True)
+        _, decoder_times = timed(lambda: whisper.decode(model, features, options), repeat)
+        entry["decoder"] = percentiles(decoder_times)
+
+        _, e2e_times = timed(lambda: model.transcribe(audio, language="en", fp16=fp16), repeat)
+        entry["transcribe"] = percentiles(e2e_times)
+        results[f"whisper:{model_size}"] = entry
+
+    if use_hf:
+        pipe, load_times = timed(lambda: hf_model_pool.get_pipeline(DEFAULT_MODEL_ID))
+        # Same chunking, batch size and token budget as transcribe_with_hf would use
+        settings = pipeline_settings(len(audio) / SAMPLE_RATE, hf_model_pool.pipeline_key(DEFAULT_MODEL_ID), pipe.device.type)
+        _, pipe_times = timed(lambda: pipe({"raw": audio, "sampling_rate": SAMPLE_RATE}, generate_kwargs=settings["generate"], **settings["call"]), repeat)
+        results[f"hf:{DEFAULT_MODEL_ID}"] = {"load": load_times[0], "transcribe": percentiles(pipe_times)}
+
+    return results
+
+
+def multipart_body(audio_bytes, language):
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    body.write(f"--{boundary}\r\nContent-Disposition: form-data; name=\"language\"\r\n\r\n{language}\r\n".encode("utf-8"))
+    body.write(f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"audio.webm\"\r\n"
+               f"Content-Type: application/octet-stream\r\n\r\n".encode("utf-8"))
+    body.write(audio_bytes)
+    body.write(f"\r\n--{boundary}--\r\n".encode("utf-8"))
+    return body.getvalue(), f"multipart/form-data; boundary={boundary}"
+
+
+def post(url, data, content_type):
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": content_type}, method="POST")
+    with urllib.request.urlopen(request, timeout=3600) as response:
+        return json.loads(response.read())
+
+
+def start_server():
+    """Run the FastAPI app in-process on a free port and return its base URL"""
+    import uvicorn
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config("main:app", host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def load_fixture(audio_path):
+    """16 kHz mono float32 samples of the benchmark audio (WAV read directly, anything else through ffmpeg)"""
+    try:
+        with wave.open(audio_path, "rb") as f:
+            if f.getframerate() == SAMPLE_RATE and f.getnchannels() == 1 and f.getsampwidth() == 2:
+                return np.frombuffer(f.readframes(f.getnframes()), np.int16).astype(np.float32) / 32768.0
+    except (wave.Error, EOFError):
+        pass
+    import whisper
+    return whisper.load_audio(audio_path)
+
+
+def wav_bytes(audio):
+    """Encode float32 samples as a 16-bit mono WAV file"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+def unique_variants(audio, count):
+    """
+    Copies of the audio that differ by inaudible seeded noise, so every request hashes
+    differently and misses the transcription cache while decoding the same speech.
+    """
+    return [wav_bytes(audio + np.random.default_rng(seed).normal(0, 1e-4, len(audio)).astype(np.float32)) for seed in range(1, count + 1)]
+
+
+def bench_e2e(base_url, audio_path, model_size, clients, requests):
+    """
+    Upload + transcribe latency through the HTTP API under concurrent clients.
+
+    The cold pass sends a distinct variant of the audio per request, so every
+    transcription runs inference; the warm pass sends the same variants again and
+    measures requests served from the transcription cache.
+    """
+    variants = unique_variants(load_fixture(audio_path), requests)
+
+    def one_request(audio_bytes):
+        start = time.perf_counter()
+        body, content_type = multipart_body(audio_bytes, "english")
+        session = post(f"{base_url}/api/upload-audio", body, content_type)
+        uploaded = time.perf_counter()
+        payload = json.dumps({
+            "date_folder": session["date_folder"],
+            "session_folder": session["session_folder"],
+            "language": "english",
+            "model_size": model_size,
+        }).encode("utf-8")
+        result = post(f"{base_url}/api/transcribe", payload, "application/json")
+        return uploaded - start, time.perf_counter() - start, bool(result.get("cached"))
+
+    def run_pass():
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            timings = list(executor.map(one_request, variants))
+        wall = time.perf_counter() - start
+        return {
+            "upload": percentiles([t[0] for t in timings]),
+            "end_to_end": percentiles([t[1] for t in timings]),
+            "throughput_rps": requests / wall,
+            "cache_hits": sum(1 for t in timings if t[2]),
+        }
+
+    return {
+        "clients": clients,
+        "requests": requests,
+        "model_size": model_size,
+        # Every request runs inference (cache_hits should be 0)
+        "cold": run_pass(),
+        # The same audio again, answered by the transcription cache
+        "warm": run_pass(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcription latency and throughput")
+    parser.add_argument("--audio", help="Fixture audio file (default: synthetic speech-like WAV)")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Length of the synthetic audio")
+    parser.add_argument("--models", nargs="+", default=["tiny"], help="Whisper model sizes to benchmark")
+    parser.add_argument("--hf", action="store_true", help="Also benchmark the HuggingFace pipeline")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions per stage")
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent API clients")
+    parser.add_argument("--requests", type=int, default=12, help="Total API requests")
+    parser.add_argument("--url", help="Benchmark a running server instead of starting one in-process")
+    parser.add_argument("--skip-stages", action="store_true")
+    parser.add_argument("--skip-e2e", action="store_true")
+    parser.add_argument("--startup-only", action="store_true", help="Only measure API startup time")
+    parser.add_argument("--check-startup", action="store_true",
+                        help="Exit non-zero if startup exceeds the target or imports torch/whisper/transformers")
+    parser.add_argument("--startup-target", type=float, default=STARTUP_TARGET_SECONDS)
+    parser.add_argument("--output", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    # Allow running from the repository root as well as from backend/
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    audio_path = args.audio
+    if audio_path is None:
+        audio_path = synthetic_wav(os.path.join(tempfile.mkdtemp(), "benchmark.wav"), args.seconds)
+
+    import torch
+
+    report = {
+        "timestamp": time.time(),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "torch": torch.__version__,
+            "cuda": torch.cuda.is_available(),
+        },
+        "audio": args.audio or f"synthetic:{args.seconds}s",
+    }
+
+    report["startup"] = bench_startup(args.startup_target)
+
+    if not args.skip_stages and not args.startup_only:
+        report["stages"] = bench_stages(audio_path, args.models, args.repeat, args.hf)
+
+    if not args.skip_e2e and not args.startup_only:
+        base_url = args.url or start_server()
+        report["e2e"] = bench_e2e(base_url, audio_path, args.models[0], args.clients, args.requests)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.check_startup and not report["startup"]["within_target"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def get_device():
+    """Determine the appropriate device (CUDA GPU or CPU) for running the models of every engine."""
+    import torch
+
+    cuda_available = torch.cuda.is_available()
+    logger.info(f"CUDA available: {cuda_available}")
+
+    if cuda_available:
+        # Get GPU memory info
+        device_props = torch.cuda.get_device_properties(0)
+        logger.info(f"GPU device: {torch.cuda.get_device_name(0)}")
+        logger.info(f"GPU device count: {torch.cuda.device_count()}")
+        logger.info(f"GPU memory: {device_props.total_memory / 1024**3:.2f} GB")
+        device = "cuda"
+    else:
+        logger.info("No CUDA device available. Using CPU instead.")
+        device = "cpu"
+
+    return device
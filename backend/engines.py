@@ -0,0 +1,317 @@
+"""
+Transcription engines behind one interface, and the router that picks one per request.
+
+An engine wraps a backend (model pool, loading, decoding) and exposes load, transcribe,
+transcribe_batch and stream. Engines register themselves with register_engine(); extra
+backends are added by listing their modules in ENGINE_MODULES, without touching main.py.
+"""
+import os
+import logging
+import importlib
+import importlib.util
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from job_queue import DEFAULT_REALTIME_FACTORS
+from precision import PRECISIONS, WHISPER_PRECISIONS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Modules imported at startup that call register_engine(), e.g. "my_engines.ctranslate"
+ENGINE_MODULES = [m.strip() for m in os.environ.get("ENGINE_MODULES", "").split(",") if m.strip()]
+# Seconds a routing decision charges for a model that is not resident yet
+ENGINE_LOAD_SECONDS = float(os.environ.get("ENGINE_LOAD_SECONDS", "10"))
+# Engine preferred by "auto" routing when candidates are expected to be equally fast
+DEFAULT_ENGINE = os.environ.get("DEFAULT_ENGINE", "whisper")
+
+# Relative accuracy of each model; "auto" routing never picks one below the requested model
+MODEL_QUALITY = {
+    "tiny": 0,
+    "base": 1,
+    "small": 2,
+    "medium": 3,
+    "turbo": 4,
+    "large-v3": 5,
+}
+
+
+class Engine:
+    """
+    Base class of a transcription backend.
+
+    Subclasses set name and models, and implement load() and transcribe(); the
+    defaults of the other methods are correct, if not the fastest, for any backend.
+    """
+
+    name = None
+    models = []  # model names accepted by resolve_model()
+    default_model = None
+    supports_long_audio = False  # whether transcribe() honours long_audio
+    supports_streaming = False
+    requires = []  # modules that must be importable for the engine to run
+    precisions = PRECISIONS  # precision variants the engine can run
+
+    def available(self):
+        """Whether the engine's dependencies are installed"""
+        return all(importlib.util.find_spec(module) is not None for module in self.requires)
+
+    def resolve_model(self, model_size=None):
+        """Map a requested model size to one of this engine's models (ValueError if unsupported)"""
+        model = (model_size or self.default_model).lower()
+        if model not in self.models:
+            raise ValueError(f"Invalid model size. Choose from: {', '.join(self.models)}")
+        return model
+
+    def quality(self, model):
+        return MODEL_QUALITY.get(model, 0)
+
+    def supports(self, language_code):
+        """Whether the engine can transcribe this Whisper language code"""
+        return True
+
+    def load(self, model, precision="auto"):
+        """Load a model into the engine's pool"""
+        raise NotImplementedError
+
+    def is_loaded(self, model, precision="auto"):
+        return False
+
+    def transcribe(self, audio_path, language, model, use_vad=False, long_audio=False, precision="auto", assisted=False, timings=None):
+        """
+        Transcribe one recording.
+
+        timings, if given, is filled with "inference": seconds spent decoding, excluding
+        model loads, which is what the router learns throughput from.
+
+        Returns:
+            Tuple of (text, segments) with segments on the recording's timeline
+        """
+        raise NotImplementedError
+
+    def transcribe_batch(self, audio_paths, language, model, **options):
+        """Transcribe several recordings with the same settings; returns a list of (text, segments)"""
+        return [self.transcribe(path, language, model, **options) for path in audio_paths]
+
+    def stream(self, language, model):
+        """Create a StreamingTranscriber (insert_audio / ready / process / text)"""
+        raise NotImplementedError(f"The {self.name} engine does not support streaming")
+
+    def stats(self):
+        return {}
+
+
+class WhisperEngine(Engine):
+    """openai-whisper models from the shared ModelPool, with cross-request batching and long-audio fan-out"""
+
+    name = "whisper"
+    models = ["tiny", "base", "small", "medium", "large-v3", "turbo"]
+    default_model = "turbo"
+    supports_long_audio = True
+    supports_streaming = True
+    requires = ["whisper"]
+    precisions = WHISPER_PRECISIONS
+
+    def load(self, model, precision="auto"):
+        from transcription import model_pool
+        return model_pool.get_model(model, precision)
+
+    def is_loaded(self, model, precision="auto"):
+        from transcription import model_pool
+        return model_pool.is_loaded(model, precision)
+
+    def transcribe(self, audio_path, language, model, use_vad=False, long_audio=False, precision="auto", assisted=False, timings=None):
+        from transcription import transcribe_with_pool
+        return transcribe_with_pool(
+            audio_path, language, model, use_vad=use_vad, long_audio=long_audio, precision=precision, return_segments=True, assisted=assisted, timings=timings
+        )
+
+    def transcribe_batch(self, audio_paths, language, model, **options):
+        from batching import BATCHING_ENABLED
+
+        if not BATCHING_ENABLED or len(audio_paths) < 2:
+            # Decodes on one model hold its inference lock, so concurrent calls would only queue up
+            return super().transcribe_batch(audio_paths, language, model, **options)
+        # Concurrent calls let the WhisperBatcher decode short clips in one forward pass
+        with ThreadPoolExecutor(max_workers=max(1, len(audio_paths))) as executor:
+            return list(executor.map(lambda path: self.transcribe(path, language, model, **options), audio_paths))
+
+    def stream(self, language, model):
+        from streaming import create_stream
+        return create_stream(language, model)
+
+    def stats(self):
+        from transcription import model_pool
+        return model_pool.stats()
+
+
+class HFEngine(Engine):
+    """HuggingFace transformers pipelines for turbo and large-v3 (chunked, batched long-form decoding)"""
+
+    name = "hf"
+    requires = ["transformers"]
+
+    def __init__(self):
+        from hf_transcription import DEFAULT_MODEL_ID, LARGE_V3_MODEL_ID
+        self.model_id = DEFAULT_MODEL_ID
+        self.large_model_id = LARGE_V3_MODEL_ID
+        self.models = [self.model_id, self.large_model_id]
+        self.default_model = self.model_id
+
+    def resolve_model(self, model_size=None):
+        # large-v3 gets the full model (which assisted decoding can speed up); every other size turbo
+        if model_size and model_size.lower() in ("large-v3", self.large_model_id):
+            return self.large_model_id
+        return self.model_id
+
+    def quality(self, model):
+        return MODEL_QUALITY["large-v3" if model == self.large_model_id else "turbo"]
+
+    def load(self, model, precision="auto"):
+        from hf_transcription import hf_model_pool
+        return hf_model_pool.get_pipeline(model, precision)
+
+    def is_loaded(self, model, precision="auto"):
+        from hf_transcription import hf_model_pool
+        return hf_model_pool.is_loaded(model, precision)
+
+    def transcribe(self, audio_path, language, model, use_vad=False, long_audio=False, precision="auto", assisted=False, timings=None):
+        from hf_transcription import transcribe_with_hf
+        return transcribe_with_hf(audio_path, language, model, use_vad=use_vad, precision=precision, return_segments=True, assisted=assisted, timings=timings)
+
+    def stats(self):
+        from hf_transcription import hf_model_pool
+        return hf_model_pool.stats()
+
+
+# Registered engines by name
+ENGINES = {}
+
+
+def register_engine(engine):
+    """Make an engine available to requests as backend=engine.name"""
+    if engine.name in ENGINES:
+        logger.info(f"Replacing engine {engine.name}")
+    ENGINES[engine.name] = engine
+    return engine
+
+
+def get_engine(name):
+    """The registered engine called name (KeyError if there is none)"""
+    if name not in ENGINES:
+        raise KeyError(f"Unknown backend '{name}'. Choose from: {', '.join(list(ENGINES) + ['auto'])}")
+    return ENGINES[name]
+
+
+class EngineRouter:
+    """
+    Picks the fastest engine and model for a request from measured throughput.
+
+    Every finished inference updates an exponential moving average of seconds of
+    compute per second of audio for its (engine, model). A request is routed to the
+    candidate with the lowest expected time, counting a load for non-resident models,
+    among the models at least as accurate as the one requested.
+    """
+
+    def __init__(self, load_seconds=ENGINE_LOAD_SECONDS):
+        self.load_seconds = load_seconds
+        self.realtime_factors = {}  # (engine, model) -> seconds of compute per second of audio
+        self.observations = {}  # (engine, model) -> finished inferences measured
+        self.lock = Lock()
+
+    def realtime_factor(self, engine, model):
+        with self.lock:
+            factor = self.realtime_factors.get((engine.name, model))
+        if factor is None:
+            # Unmeasured: assume the speed of the equally accurate whisper model
+            quality = engine.quality(model)
+            same = [size for size, q in MODEL_QUALITY.items() if q == quality]
+            factor = DEFAULT_REALTIME_FACTORS.get(model) or DEFAULT_REALTIME_FACTORS.get(same[0] if same else None, 1.0)
+        return factor
+
+    def estimate(self, engine, model, audio_seconds, long_audio=False, precision="auto"):
+        """Expected seconds to transcribe audio_seconds of audio with this engine and model"""
+        from long_audio import LONG_AUDIO_WORKERS, LONG_AUDIO_MIN_SECONDS
+
+        seconds = self.realtime_factor(engine, model) * (audio_seconds or 30.0)
+        if long_audio and engine.supports_long_audio and (audio_seconds or 0) >= LONG_AUDIO_MIN_SECONDS:
+            seconds /= LONG_AUDIO_WORKERS
+        if not engine.is_loaded(model, precision):
+            seconds += self.load_seconds
+        return seconds
+
+    def route(self, model_size, audio_seconds, language_code=None, long_audio=False, precision="auto"):
+        """
+        Choose an engine and model for a request.
+
+        Args:
+            model_size: The requested whisper model size, the accuracy floor
+            audio_seconds: Length of the recording
+            language_code: Whisper language code, or None if not known yet
+            long_audio: Whether long recordings may be split across processes
+            precision: Model precision variant to run
+
+        Returns:
+            Tuple of (engine name, model)
+        """
+        floor = MODEL_QUALITY.get(model_size.lower(), 0)
+        candidates = []
+        for engine in list(ENGINES.values()):
+            if not engine.available() or precision not in engine.precisions:
+                continue
+            if language_code is not None and not engine.supports(language_code):
+                continue
+            for model in engine.models:
+                if engine.quality(model) < floor:
+                    continue
+                candidates.append((self.estimate(engine, model, audio_seconds, long_audio, precision), engine.name, model))
+        if not candidates:
+            return DEFAULT_ENGINE, model_size.lower()
+        # Equal estimates (e.g. nothing measured yet) go to the default engine
+        seconds, name, model = min(candidates, key=lambda c: (c[0], c[1] != DEFAULT_ENGINE))
+        logger.info(f"Routing {audio_seconds or 0:.1f}s of audio to {name}/{model} (expected {seconds:.1f}s)")
+        return name, model
+
+    def observe(self, engine_name, model, audio_seconds, seconds):
+        """Record the compute time of a finished inference"""
+        if not audio_seconds:
+            return
+        observed = seconds / audio_seconds
+        key = (engine_name, model)
+        with self.lock:
+            previous = self.realtime_factors.get(key, observed)
+            self.realtime_factors[key] = 0.8 * previous + 0.2 * observed
+            self.observations[key] = self.observations.get(key, 0) + 1
+
+    def stats(self):
+        """Registered engines, their models and measured speed for the /api/engines endpoint"""
+        with self.lock:
+            measured = dict(self.realtime_factors)
+            counts = dict(self.observations)
+        return {
+            name: {
+                "models": list(engine.models),
+                "available": engine.available(),
+                "precisions": list(engine.precisions),
+                "supports_streaming": engine.supports_streaming,
+                "supports_long_audio": engine.supports_long_audio,
+                "realtime_factors": {model: measured.get((name, model)) for model in engine.models},
+                "observations": {model: counts.get((name, model), 0) for model in engine.models},
+            }
+            for name, engine in ENGINES.items()
+        }
+
+
+register_engine(WhisperEngine())
+register_engine(HFEngine())
+
+# Global router
+engine_router = EngineRouter()
+
+# Third-party engines register themselves on import
+for module_name in ENGINE_MODULES:
+    try:
+        importlib.import_module(module_name)
+        logger.info(f"Loaded engine module {module_name}")
+    except Exception as e:
+        logger.error(f"Could not load engine module {module_name}: {str(e)}")
@@ -1,9 +1,17 @@
 import os
 import logging
-import torch
-from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
 from threading import Lock
 import time
+from audio_features import load_pcm, SAMPLE_RATE
+from vad import apply_vad
+from metrics import timed_lock, TRANSCRIPTION_STAGE_SECONDS, MODEL_LOAD_SECONDS, POOL_REQUESTS_TOTAL, POOL_EVICTIONS_TOTAL
+from precision import check_precision, quantize_int8
+from memory_utils import module_footprint, default_budget, release_memory, HF_POOL_FRACTION
+from speculative import HF_DRAFT_MODEL_ID, hf_draft_compatible
+from language_id import to_language_code
+from weight_cache import load_hf_model
+from hf_tuning import pipeline_settings, hf_batch_tuner
+from device import get_device
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -11,64 +19,77 @@ logger = logging.getLogger(__name__)
 
 # Default model ID for Whisper Large V3 Turbo from HuggingFace
 DEFAULT_MODEL_ID = "openai/whisper-large-v3-turbo"
+# Full large-v3, served when requested (the model HF_DRAFT_MODEL_ID can assist)
+LARGE_V3_MODEL_ID = "openai/whisper-large-v3"
+
+# Memory budget for resident HF pipelines (default: 25% of RAM, or VRAM on CUDA)
+HF_MODEL_POOL_MAX_BYTES = int(os.environ.get("HF_MODEL_POOL_MAX_BYTES", "0")) or None
 
 class HFModelPool:
-    def __init__(self, max_models=1):
+    def __init__(self, max_bytes=None):
         self.models = {}
         self.processors = {}  # Store processors alongside models
         self.pipelines = {}  # Store complete pipelines
         self.last_used = {}
-        self.max_models = max_models
+        self.footprints = {}  # key -> bytes of parameters and buffers
+        self.max_bytes = max_bytes
+        self.evictions = 0
         self.lock = Lock()
   
-    def get_pipeline(self, model_id=DEFAULT_MODEL_ID):
-        """Get or create a speech-to-text pipeline for the specified model"""
-        with self.lock:
+    def pipeline_key(self, model_id=DEFAULT_MODEL_ID, precision="auto"):
+        """Pool key of a pipeline; "auto" keeps the original key"""
+        device = get_device()
+        return f"{model_id}_{device}" if precision == "auto" else f"{model_id}_{device}_{precision}"
+
+    def get_pipeline(self, model_id=DEFAULT_MODEL_ID, precision="auto"):
+        """Get or create a speech-to-text pipeline for the specified model and precision"""
+        with timed_lock(self.lock, "hf"):
             device = get_device()
-            key = f"{model_id}_{device}"
+            check_precision(precision, device)
+            # Each precision is its own pool entry; "auto" keeps the original key
+            key = f"{model_id}_{device}" if precision == "auto" else f"{model_id}_{device}_{precision}"
             
             if key in self.pipelines:
                 self.last_used[key] = time.time()
+                POOL_REQUESTS_TOTAL.inc(pool="hf", result="hit")
                 return self.pipelines[key]
+            POOL_REQUESTS_TOTAL.inc(pool="hf", result="miss")
+            load_start = time.perf_counter()
             
             logger.info(f"Loading HuggingFace model {model_id} on {device}...")
+            # transformers is only imported once the HF backend is first used
+            from transformers import pipeline
             
-            # Load model and processor
-            torch_dtype = torch.float16 if device == "cuda" else torch.float32
+            # Load model and processor (int8 loads in fp32, then quantizes the Linear layers)
+            torch_dtype = _torch_dtype(precision, device)
             
             try:
-                model = AutoModelForSpeechSeq2Seq.from_pretrained(
-                    model_id,
-                    torch_dtype=torch_dtype,
-                    low_cpu_mem_usage=True,
-                    use_safetensors=True
-                )
+                # Memory-mapped from the converted-weight cache after the first load
+                model, processor = load_hf_model(model_id, torch_dtype)
                 model.to(device)
+                if precision == "int8":
+                    model = quantize_int8(model)
                 
-                processor = AutoProcessor.from_pretrained(model_id)
-                
-                # Create the pipeline
+                # Create the pipeline; chunking, batch size and token budget are chosen per call
                 pipe = pipeline(
                     "automatic-speech-recognition",
                     model=model,
                     tokenizer=processor.tokenizer,
                     feature_extractor=processor.feature_extractor,
-                    max_new_tokens=128,
-                    chunk_length_s=30,
-                    batch_size=16,
                     return_timestamps=True,
                     torch_dtype=torch_dtype,
                     device=device,
                 )
                 
-                # Remove oldest pipeline if pool is full
-                if len(self.pipelines) >= self.max_models:
-                    oldest_key = min(self.last_used.items(), key=lambda x: x[1])[0]
-                    logger.info(f"Removing oldest model {oldest_key} from pool")
-                    del self.pipelines[oldest_key]
-                    del self.last_used[oldest_key]
+                MODEL_LOAD_SECONDS.observe(time.perf_counter() - load_start, pool="hf", model=key)
+                footprint = module_footprint(model)
+                logger.info(f"HuggingFace model {model_id} ({precision}) uses {footprint / 1024**2:.1f} MB")
+                self._evict_for(footprint, device)
                 
+                self.models[key] = model
+                self.processors[key] = processor
                 self.pipelines[key] = pipe
+                self.footprints[key] = footprint
                 self.last_used[key] = time.time()
                 
                 return pipe
@@ -81,25 +102,85 @@ class HFModelPool:
                 else:
                     raise
 
-# Create global model pool
-hf_model_pool = HFModelPool(max_models=1)  # Set to 1 to manage memory usage
+    def get_draft_model(self, model_id=HF_DRAFT_MODEL_ID, precision="auto"):
+        """
+        Get or load a draft model for assisted generation, pooled and evicted like the pipelines.
 
-def get_device():
-    """Determine the appropriate device (CUDA GPU or CPU) for running the model."""
-    cuda_available = torch.cuda.is_available()
-    logger.info(f"CUDA available: {cuda_available}")
-    
-    if cuda_available:
-        # Get GPU memory info
-        device_props = torch.cuda.get_device_properties(0)
-        logger.info(f"GPU device: {torch.cuda.get_device_name(0)}")
-        logger.info(f"GPU memory: {device_props.total_memory / 1024**3:.2f} GB")
-        device = "cuda"
-    else:
-        logger.info("No CUDA device available. Using CPU instead.")
-        device = "cpu"
-        
-    return device
+        Only the decoder is loaded: generate() hands it the main model's encoder output.
+        """
+        with timed_lock(self.lock, "hf"):
+            device = get_device()
+            check_precision(precision, device)
+            key = f"{model_id}_{device}_draft" if precision == "auto" else f"{model_id}_{device}_{precision}_draft"
+
+            if key in self.models:
+                self.last_used[key] = time.time()
+                POOL_REQUESTS_TOTAL.inc(pool="hf", result="hit")
+                return self.models[key]
+            POOL_REQUESTS_TOTAL.inc(pool="hf", result="miss")
+
+            logger.info(f"Loading HuggingFace draft model {model_id} on {device}...")
+            with MODEL_LOAD_SECONDS.time(pool="hf", model=key):
+                model, _ = load_hf_model(model_id, _torch_dtype(precision, device), with_processor=False, decoder_only=True)
+                model.to(device)
+                if precision == "int8":
+                    model = quantize_int8(model)
+
+            footprint = module_footprint(model)
+            self._evict_for(footprint, device)
+            self.models[key] = model
+            self.footprints[key] = footprint
+            self.last_used[key] = time.time()
+            return model
+
+    def is_loaded(self, model_id=DEFAULT_MODEL_ID, precision="auto"):
+        """Whether get_pipeline would return without loading"""
+        key = self.pipeline_key(model_id, precision)
+        with self.lock:
+            return key in self.pipelines
+
+    def _evict_for(self, needed, device):
+        """Evict least recently used pipelines and draft models until needed bytes fit in the budget (lock held)"""
+        budget = self.max_bytes or default_budget(device, HF_POOL_FRACTION)
+        evicted = False
+        while self.models and sum(self.footprints.values()) + needed > budget:
+            oldest_key = min(self.last_used.items(), key=lambda x: x[1])[0]
+            logger.info(f"Removing oldest model {oldest_key} from pool")
+            # Drop every reference to the model so its memory is actually freed (draft models have no pipeline)
+            self.pipelines.pop(oldest_key, None)
+            self.processors.pop(oldest_key, None)
+            del self.models[oldest_key]
+            del self.footprints[oldest_key]
+            del self.last_used[oldest_key]
+            self.evictions += 1
+            POOL_EVICTIONS_TOTAL.inc(pool="hf")
+            evicted = True
+        if evicted:
+            release_memory()
+
+    def stats(self):
+        """Pool occupancy for the /api/models endpoint"""
+        with self.lock:
+            return {
+                "max_bytes": self.max_bytes or default_budget(get_device(), HF_POOL_FRACTION),
+                "used_bytes": sum(self.footprints.values()),
+                "models": {key: {"bytes": self.footprints[key], "last_used": self.last_used[key]} for key in self.models},
+                "evictions": self.evictions,
+                "batch_tuning": hf_batch_tuner.stats(),
+            }
+
+def _torch_dtype(precision, device):
+    """Weight dtype for a precision (int8 loads in fp32 before quantizing)"""
+    import torch
+
+    if precision == "bf16":
+        return torch.bfloat16
+    if precision in ("fp32", "int8"):
+        return torch.float32
+    return torch.float16 if device == "cuda" else torch.float32
+
+# Create global model pool
+hf_model_pool = HFModelPool(max_bytes=HF_MODEL_POOL_MAX_BYTES)
 
 def preload_hf_model(model_id=DEFAULT_MODEL_ID):
     """Preload the HuggingFace Whisper model into memory"""
@@ -107,15 +188,14 @@ def preload_hf_model(model_id=DEFAULT_MODEL_ID):
     device = get_device()
     
     # Force garbage collection to free up memory
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
+    release_memory()
     
     # Preload model into pool
     pipeline = hf_model_pool.get_pipeline(model_id)
     logger.info(f"Successfully preloaded HuggingFace model {model_id} on {device}")
     return pipeline
 
-def transcribe_with_hf(audio_path, language="tiếng việt", model_id=DEFAULT_MODEL_ID):
+def transcribe_with_hf(audio_path, language="tiếng việt", model_id=DEFAULT_MODEL_ID, use_vad=False, precision="auto", return_segments=False, assisted=False, chunk_length_s=None, batch_size=None, max_new_tokens=None, timings=None):
     """
     Transcribe the audio file using the HuggingFace Whisper model.
     
@@ -123,32 +203,76 @@ def transcribe_with_hf(audio_path, language="tiếng việt", model_id=DEFAULT_M
         audio_path: Path to the audio file to transcribe
         language: Language of the audio (english or vietnamese)
         model_id: HuggingFace model ID to use
+        use_vad: Only decode the speech regions found by the energy VAD
+        precision: "auto", "fp32", "bf16" or "int8" (dynamic quantization, CPU only)
+        return_segments: Also return the timed chunks as segments
+        assisted: Let the HF_DRAFT_MODEL_ID draft tokens that the main model verifies
+        chunk_length_s: Window length for long audio (defaults to HF_CHUNK_LENGTH_S)
+        batch_size: Chunks decoded together (defaults to HF_BATCH_SIZE, or the auto-tuner)
+        max_new_tokens: Token budget per window (defaults to HF_MAX_NEW_TOKENS, or all a window can hold)
+        timings: Dict that receives "inference", the seconds spent in the pipeline call
         
     Returns:
-        Transcription text
+        Transcription text, or (text, segments) with return_segments
     """
     try:
-        # Map UI language choices to Whisper language codes
-        language_map = {
-            "english": "en",
-            "tiếng việt": "vi"
-        }
-        
-        language_code = language_map.get(language.lower(), "vi")
+        # Map UI language choices to Whisper language codes (detected codes pass through)
+        language_code = to_language_code(language)
         audio_path = os.path.abspath(audio_path)
         
         # Log transcription start
         logger.info(f"Starting HF transcription for {audio_path} in {language_code}")
         
+        labels = {"backend": "hf", "model": model_id, "language": language_code}
+        total_start = time.perf_counter()
+
         # Get the pipeline
-        pipe = hf_model_pool.get_pipeline(model_id)
+        with TRANSCRIPTION_STAGE_SECONDS.time(stage="get_model", **labels):
+            pipe = hf_model_pool.get_pipeline(model_id, precision)
         
         # Generate transcription
         logger.info("Running transcription...")
-        result = pipe(
-            audio_path,
-            generate_kwargs={"language": language_code, "task": "transcribe"}
-        )
+        with TRANSCRIPTION_STAGE_SECONDS.time(stage="load_audio", **labels):
+            audio = load_pcm(audio_path)
+        if use_vad:
+            with TRANSCRIPTION_STAGE_SECONDS.time(stage="vad", **labels):
+                audio, speech_map = apply_vad(audio)
+            if len(audio) == 0:
+                logger.info("No speech detected, skipping decode")
+                return ("", []) if return_segments else ""
+        # Short clips decode unchunked; long ones in batches of chunks sized for this host
+        duration = len(audio) / SAMPLE_RATE
+        key = hf_model_pool.pipeline_key(model_id, precision)
+        settings = pipeline_settings(duration, key, pipe.device.type, chunk_length_s, batch_size, max_new_tokens)
+        generate_kwargs = {"language": language_code, "task": "transcribe", **settings["generate"]}
+        call_kwargs = dict(settings["call"])
+        if assisted and not hf_draft_compatible(model_id):
+            # The draft shares the main model's encoder output; it does not match this model's
+            logger.warning(f"{HF_DRAFT_MODEL_ID} cannot assist {model_id}, decoding normally")
+            assisted = False
+        if assisted:
+            with TRANSCRIPTION_STAGE_SECONDS.time(stage="get_draft_model", **labels):
+                generate_kwargs["assistant_model"] = hf_model_pool.get_draft_model(HF_DRAFT_MODEL_ID, precision)
+            # Assisted generation only supports one sequence at a time
+            call_kwargs["batch_size"] = 1
+        tuned = settings["tuned"] and not assisted
+        if tuned and pipe.device.type == "cuda":
+            import torch
+            torch.cuda.reset_peak_memory_stats()
+            baseline = torch.cuda.memory_allocated()
+        inference_start = time.perf_counter()
+        with TRANSCRIPTION_STAGE_SECONDS.time(stage="inference", **labels):
+            result = pipe(
+                {"raw": audio, "sampling_rate": SAMPLE_RATE},
+                generate_kwargs=generate_kwargs,
+                **call_kwargs
+            )
+        if timings is not None:
+            timings["inference"] = time.perf_counter() - inference_start
+        if tuned:
+            peak_bytes = torch.cuda.max_memory_allocated() - baseline if pipe.device.type == "cuda" else None
+            hf_batch_tuner.record(key, call_kwargs["batch_size"], duration, time.perf_counter() - inference_start, peak_bytes)
+        TRANSCRIPTION_STAGE_SECONDS.observe(time.perf_counter() - total_start, stage="total", **labels)
         
         # Extract the transcribed text
         transcription = result["text"]
@@ -156,7 +280,16 @@ def transcribe_with_hf(audio_path, language="tiếng việt", model_id=DEFAULT_M
         # Log successful transcription
         logger.info(f"HF Transcription complete: {len(transcription)} characters")
         
-        return transcription
+        if not return_segments:
+            return transcription
+        # The last chunk may have no end timestamp; it runs to the end of the audio
+        segments = [
+            {"start": round(chunk["timestamp"][0] or 0.0, 2), "end": round(chunk["timestamp"][1] or duration, 2), "text": chunk["text"].strip()}
+            for chunk in result.get("chunks", [])
+        ]
+        if use_vad:
+            speech_map.remap_segments(segments)
+        return transcription, segments
         
     except Exception as e:
         logger.error(f"HF Transcription error: {str(e)}")
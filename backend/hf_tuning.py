@@ -0,0 +1,138 @@
+import os
+import math
+import logging
+from threading import Lock
+from memory_utils import available_memory
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Chunked decoding settings for the HF pipeline, overridable from the environment
+HF_CHUNK_LENGTH_S = float(os.environ.get("HF_CHUNK_LENGTH_S", "30"))
+HF_STRIDE_LENGTH_S = float(os.environ.get("HF_STRIDE_LENGTH_S", "0"))  # 0 = pipeline default (chunk / 6)
+HF_BATCH_SIZE = int(os.environ.get("HF_BATCH_SIZE", "0"))  # 0 = auto-tuned
+HF_MAX_BATCH_SIZE = int(os.environ.get("HF_MAX_BATCH_SIZE", "32"))
+HF_MAX_NEW_TOKENS = int(os.environ.get("HF_MAX_NEW_TOKENS", "0"))  # 0 = as many as a window can hold
+# Working memory per batched chunk until one has been measured (CPU, or before the first CUDA run)
+HF_BATCH_ITEM_BYTES = int(os.environ.get("HF_BATCH_ITEM_BYTES", str(256 * 1024**2)))
+
+# Whisper's decoder has 448 positions; leave room for the start-of-transcript prompt.
+# max_new_tokens only caps generation (decoding stops at end-of-text anyway), so a lower
+# budget saves nothing and would cut off fast speech: Vietnamese alone runs ~8 tokens/s
+MAX_NEW_TOKENS_LIMIT = 440
+# Fraction of free memory batched chunks may take
+BATCH_MEMORY_FRACTION = 0.5
+
+
+def chunk_count(audio_seconds, chunk_length_s, stride_length_s=None):
+    """Number of windows the pipeline cuts audio_seconds into (consecutive chunks overlap by 2 * stride)"""
+    stride = chunk_length_s / 6 if not stride_length_s else stride_length_s
+    if audio_seconds <= chunk_length_s:
+        return 1
+    step = chunk_length_s - 2 * stride
+    return 1 + math.ceil((audio_seconds - chunk_length_s) / step)
+
+
+class BatchSizeTuner:
+    """
+    Picks the pipeline batch size per model from free memory and measured throughput.
+
+    Batch sizes are powers of two up to what fits in free memory. Starting from 16 (or
+    the cap), each full batch records audio seconds decoded per second; while the best
+    size is at the edge of what has been tried, the next size beyond it is tried once,
+    so the tuner climbs to the host's fastest batch size and stays there.
+    """
+
+    def __init__(self, max_batch_size=HF_MAX_BATCH_SIZE, item_bytes=HF_BATCH_ITEM_BYTES):
+        self.max_batch_size = max_batch_size
+        self.default_item_bytes = item_bytes
+        self.item_bytes = {}  # key -> measured working bytes per batched chunk
+        self.throughput = {}  # key -> {batch size: audio seconds per second}
+        self.lock = Lock()
+
+    def memory_cap(self, key, device):
+        """Largest batch size whose working memory fits in a fraction of what is free"""
+        with self.lock:
+            item_bytes = self.item_bytes.get(key, self.default_item_bytes)
+        free = available_memory(device)
+        if not free:
+            return self.max_batch_size
+        return max(1, min(self.max_batch_size, int(free * BATCH_MEMORY_FRACTION // item_bytes)))
+
+    def batch_size(self, key, device):
+        cap = self.memory_cap(key, device)
+        sizes = [2**i for i in range(int(math.log2(cap)) + 1)]
+        with self.lock:
+            measured = {size: rate for size, rate in self.throughput.get(key, {}).items() if size <= cap}
+        if not measured:
+            return min(16, sizes[-1])
+        best = max(measured, key=measured.get)
+        index = sizes.index(best) if best in sizes else len(sizes) - 1
+        # Explore one step up, then one step down, from the best size measured so far
+        if best == max(measured) and index + 1 < len(sizes) and sizes[index + 1] not in measured:
+            return sizes[index + 1]
+        if best == min(measured) and index > 0 and sizes[index - 1] not in measured:
+            return sizes[index - 1]
+        return best
+
+    def record(self, key, batch_size, audio_seconds, seconds, peak_bytes=None):
+        """Record a chunked run where every batch (but the last) was full"""
+        if seconds <= 0:
+            return
+        rate = audio_seconds / seconds
+        with self.lock:
+            rates = self.throughput.setdefault(key, {})
+            previous = rates.get(batch_size, rate)
+            rates[batch_size] = 0.8 * previous + 0.2 * rate
+            if peak_bytes:
+                self.item_bytes[key] = max(self.item_bytes.get(key, 0), peak_bytes // batch_size)
+
+    def stats(self):
+        with self.lock:
+            return {
+                key: {
+                    "throughput": dict(sorted(rates.items())),
+                    "item_bytes": self.item_bytes.get(key, self.default_item_bytes),
+                }
+                for key, rates in self.throughput.items()
+            }
+
+
+# Global tuner shared by every HF pipeline
+hf_batch_tuner = BatchSizeTuner()
+
+
+def pipeline_settings(audio_seconds, key, device, chunk_length_s=None, batch_size=None, max_new_tokens=None):
+    """
+    Chunking, batching and token budget for one pipeline call.
+
+    Clips that fit in one window are decoded unchunked with a single-item batch. Longer
+    audio is chunked and batched up to its number of chunks, with the batch size from
+    HF_BATCH_SIZE or the tuner. Every window may generate up to MAX_NEW_TOKENS_LIMIT tokens.
+
+    Args:
+        audio_seconds: Length of the audio to decode
+        key: Pool key of the pipeline (the tuner learns per model, device and precision)
+        device: "cuda" or "cpu"
+        chunk_length_s, batch_size, max_new_tokens: Per-call overrides
+
+    Returns:
+        Dict with "call" (pipeline keyword arguments), "generate" (generate_kwargs), the
+        number of "chunks" and whether the run should be "tuned" (recorded with the tuner)
+    """
+    chunk_length_s = chunk_length_s or HF_CHUNK_LENGTH_S
+    # Whisper's feature extractor pads every input to a 30-second window
+    if audio_seconds <= min(chunk_length_s, 30.0):
+        budget = max_new_tokens or HF_MAX_NEW_TOKENS or MAX_NEW_TOKENS_LIMIT
+        return {"call": {"batch_size": 1}, "generate": {"max_new_tokens": budget}, "chunks": 1, "tuned": False}
+
+    chunks = chunk_count(audio_seconds, chunk_length_s, HF_STRIDE_LENGTH_S)
+    tuned = not (batch_size or HF_BATCH_SIZE)
+    batch_size = hf_batch_tuner.batch_size(key, device) if tuned else batch_size or HF_BATCH_SIZE
+    call = {"chunk_length_s": chunk_length_s, "batch_size": max(1, min(batch_size, chunks))}
+    if HF_STRIDE_LENGTH_S:
+        call["stride_length_s"] = HF_STRIDE_LENGTH_S
+    budget = max_new_tokens or HF_MAX_NEW_TOKENS or MAX_NEW_TOKENS_LIMIT
+    # Only runs with full batches of the tuner's choice say anything about that batch size
+    return {"call": call, "generate": {"max_new_tokens": budget}, "chunks": chunks, "tuned": tuned and batch_size <= chunks}
@@ -0,0 +1,336 @@
+import os
+import logging
+import time
+import uuid
+import bisect
+import asyncio
+import itertools
+from threading import Lock
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from metrics import Gauge, JOB_QUEUE_WAIT_SECONDS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Scheduler settings, overridable from the environment
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", "1"))
+TRANSCRIBE_EXECUTOR = os.environ.get("TRANSCRIBE_EXECUTOR", "thread")  # "thread" or "process"
+TRANSCRIBE_MAX_QUEUE = int(os.environ.get("TRANSCRIBE_MAX_QUEUE", "16"))
+TRANSCRIBE_JOB_HISTORY = int(os.environ.get("TRANSCRIBE_JOB_HISTORY", "256"))
+# Extra workers that only run small-model jobs, so dictation never waits behind large-v3
+TRANSCRIBE_SMALL_WORKERS = int(os.environ.get("TRANSCRIBE_SMALL_WORKERS", "1"))
+TRANSCRIBE_SMALL_MODELS = [m.strip() for m in os.environ.get("TRANSCRIBE_SMALL_MODELS", "tiny,base,small").split(",") if m.strip()]
+
+# Priority classes, most urgent first; within a class jobs run earliest-deadline-first
+PRIORITIES = {"interactive": 0, "normal": 1, "batch": 2}
+
+# Initial seconds of compute per second of audio, refined from finished jobs
+DEFAULT_REALTIME_FACTORS = {
+    "tiny": 0.05,
+    "base": 0.08,
+    "small": 0.2,
+    "turbo": 0.35,
+    "medium": 0.5,
+    "large-v3": 1.0,
+}
+
+
+class QueueFullError(Exception):
+    """Raised when the scheduler refuses a job because the queue is full."""
+
+
+class Job:
+    def __init__(self, job_id, future, priority="normal", deadline=None, model_size=None, audio_seconds=None):
+        self.job_id = job_id
+        self.future = future
+        self.priority = priority
+        self.deadline = deadline  # absolute time.time() the result is wanted by, or None
+        self.model_size = model_size
+        self.audio_seconds = audio_seconds
+        self.small = False  # whether it ran on a reserved small-model slot
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def status(self):
+        if self.future.cancelled():
+            return "cancelled"
+        if self.future.done():
+            return "error" if self.future.exception() is not None else "done"
+        if self.future.running():
+            return "running"
+        return "queued"
+
+    def to_dict(self):
+        """Serialize the job state for the status endpoint"""
+        info = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "priority": self.priority,
+            "deadline": self.deadline,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if info["status"] == "done":
+            info["result"] = self.future.result()
+        elif info["status"] == "error":
+            info["error"] = str(self.future.exception())
+        return info
+
+
+class JobScheduler:
+    """
+    Runs jobs on a worker pool in priority order.
+
+    Jobs wait in a queue ordered by priority class, then deadline, then arrival, and are
+    handed to the executor only when a worker slot is free. small_workers extra slots only
+    take jobs for small_models, so short dictation keeps low latency while large or batch
+    jobs occupy the general slots.
+    """
+
+    def __init__(self, max_workers=1, max_queue=16, executor="thread", max_history=256, small_workers=0, small_models=()):
+        total_workers = max_workers + small_workers
+        if executor == "process":
+            self.executor = ProcessPoolExecutor(max_workers=total_workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=total_workers, thread_name_prefix="transcribe")
+        self.max_workers = max_workers
+        self.small_workers = small_workers
+        self.small_models = set(small_models)
+        self.max_queue = max_queue
+        self.max_history = max_history
+        self.jobs = {}
+        self.queue = []  # sorted (rank, deadline, seq, job, fn, args, kwargs)
+        self.sequence = itertools.count()
+        self.running = 0
+        self.running_small = 0
+        self.in_progress = set()  # jobs handed to the executor
+        self.active = 0  # queued + running jobs
+        self.realtime_factors = dict(DEFAULT_REALTIME_FACTORS)
+        self.lock = Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submit a job to the worker pool with normal priority and no deadline.
+
+        Args:
+            fn: The callable to run in a worker (must be picklable for process pools)
+            *args, **kwargs: Arguments passed to fn
+
+        Returns:
+            The Job that was scheduled
+
+        Raises:
+            QueueFullError: If the queue has no room for the job
+        """
+        return self.submit_job(fn, args, kwargs)
+
+    def submit_job(self, fn, args=(), kwargs=None, priority="normal", deadline=None, model_size=None, audio_seconds=None):
+        """
+        Submit a job with scheduling metadata.
+
+        Args:
+            fn: The callable to run in a worker (must be picklable for process pools)
+            args, kwargs: Arguments passed to fn
+            priority: One of PRIORITIES
+            deadline: Absolute time (time.time()) the result is wanted by, or None
+            model_size: Whisper model size the job runs (enables the small-model slots and runtime estimates;
+                the estimates learn from results that are dicts with an "inference_seconds" entry)
+            audio_seconds: Length of the audio (for runtime estimates)
+
+        Returns:
+            The Job that was scheduled
+
+        Raises:
+            QueueFullError: If the queue has no room for the job
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Invalid priority '{priority}'. Choose from: {', '.join(PRIORITIES)}")
+        rank = PRIORITIES[priority]
+        with self.lock:
+            capacity = self.max_workers + self.small_workers + self.max_queue
+            if self.active >= capacity:
+                raise QueueFullError(f"Transcription queue is full ({self.active} jobs in flight)")
+            # Lower-priority jobs may only fill half the queue, keeping room for interactive requests
+            # (at least one slot, so a tiny queue still accepts them when it is empty)
+            if rank > 0 and len(self.queue) >= max(1, self.max_queue // 2):
+                raise QueueFullError(f"Queue is reserved for higher-priority jobs ({len(self.queue)} queued)")
+            self.active += 1
+
+            job_id = uuid.uuid4().hex
+            job = Job(job_id, Future(), priority, deadline, model_size, audio_seconds)
+            entry = (rank, deadline if deadline is not None else float("inf"), next(self.sequence), job, fn, args, kwargs or {})
+            bisect.insort(self.queue, entry, key=lambda e: e[:3])
+            self.jobs[job_id] = job
+            self._prune_history()
+            started = self._dispatch()
+        self._watch(started)
+
+        logger.info(f"Job {job_id} queued with {priority} priority ({self.active} in flight)")
+        return job
+
+    def get_job(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    async def wait(self, job):
+        """Await a job's result from the event loop without blocking it"""
+        return await asyncio.wrap_future(job.future)
+
+    def estimate_runtime(self, model_size, audio_seconds):
+        """Estimated seconds of compute for a job, from the observed realtime factors"""
+        factor = self.realtime_factors.get(model_size, 1.0)
+        return factor * (audio_seconds or 30.0)
+
+    def estimate_completion(self, model_size, audio_seconds, priority="normal"):
+        """
+        Estimated seconds from now until a job submitted now would finish.
+
+        Counts the work queued ahead of it (same or higher priority) spread over the
+        slots it may use, the time until a slot frees up if none is free, plus its own runtime.
+        """
+        rank = PRIORITIES.get(priority, 1)
+        small = model_size in self.small_models
+        now = time.time()
+        with self.lock:
+            slots = self.max_workers + (self.small_workers if small else 0)
+            ahead = sum(
+                self.estimate_runtime(job.model_size, job.audio_seconds)
+                for entry_rank, _, _, job, _, _, _ in self.queue
+                if entry_rank <= rank and (small or job.model_size not in self.small_models)
+            )
+            running = [job for job in self.in_progress if small or not job.small]
+            remaining = [max(0.0, job.started_at + self.estimate_runtime(job.model_size, job.audio_seconds) - now) for job in running]
+        wait = ahead / max(slots, 1)
+        if len(running) >= slots and remaining:
+            wait += min(remaining)
+        return wait + self.estimate_runtime(model_size, audio_seconds)
+
+    def stats(self):
+        with self.lock:
+            queued = {name: 0 for name in PRIORITIES}
+            for _, _, _, job, _, _, _ in self.queue:
+                queued[job.priority] += 1
+            return {
+                "workers": self.max_workers,
+                "small_workers": self.small_workers,
+                "small_models": sorted(self.small_models),
+                "max_queue": self.max_queue,
+                "in_flight": self.active,
+                "running": self.running,
+                "running_small": self.running_small,
+                "queued": queued,
+                "realtime_factors": dict(self.realtime_factors),
+                "tracked_jobs": len(self.jobs),
+            }
+
+    def shutdown(self, wait=True):
+        with self.lock:
+            for entry in self.queue:
+                entry[3].future.cancel()
+            self.queue.clear()
+        self.executor.shutdown(wait=wait)
+
+    def _dispatch(self):
+        """
+        Start queued jobs while worker slots are free (lock held).
+
+        Returns the (job, inner future) pairs started; the caller passes them to _watch()
+        once the lock is released, since a finished future runs its callback immediately.
+        """
+        started = []
+        index = 0
+        while index < len(self.queue):
+            general_free = self.running < self.max_workers
+            small_free = self.running_small < self.small_workers
+            if not general_free and not small_free:
+                break
+            job = self.queue[index][3]
+            small = job.model_size in self.small_models
+            if not general_free and not small:
+                # Only a reserved slot is free; look further for a small-model job
+                index += 1
+                continue
+            _, _, _, job, fn, args, kwargs = self.queue.pop(index)
+            if not job.future.set_running_or_notify_cancel():
+                self.active -= 1
+                continue
+            # Small jobs prefer their reserved slots so the general ones stay free for large models
+            job.small = small and small_free
+            if job.small:
+                self.running_small += 1
+            else:
+                self.running += 1
+            job.started_at = time.time()
+            # Recorded here, in the parent, so it reaches /api/metrics with a process pool too
+            JOB_QUEUE_WAIT_SECONDS.observe(job.started_at - job.created_at)
+            self.in_progress.add(job)
+            try:
+                inner = self.executor.submit(fn, *args, **kwargs)
+            except Exception as e:
+                self._release(job)
+                job.future.set_exception(e)
+                continue
+            started.append((job, inner))
+        return started
+
+    def _watch(self, started):
+        # Called without the lock: _on_done takes it, and may run right here if the job already finished
+        for job, inner in started:
+            inner.add_done_callback(lambda f, job=job: self._on_done(job, f))
+
+    def _release(self, job):
+        # Free the job's slot (lock held)
+        self.in_progress.discard(job)
+        if job.small:
+            self.running_small -= 1
+        else:
+            self.running -= 1
+        self.active -= 1
+
+    def _on_done(self, job, inner):
+        job.finished_at = time.time()
+        with self.lock:
+            self._release(job)
+            # Only jobs that report their inference time count: cache hits finish in
+            # milliseconds and would drag the factors towards zero
+            result = inner.result() if inner.exception() is None else None
+            inference_seconds = result.get("inference_seconds") if isinstance(result, dict) else None
+            if inference_seconds is not None and job.model_size and job.audio_seconds:
+                # Exponential moving average of seconds of compute per second of audio
+                observed = inference_seconds / job.audio_seconds
+                previous = self.realtime_factors.get(job.model_size, observed)
+                self.realtime_factors[job.model_size] = 0.8 * previous + 0.2 * observed
+            started = self._dispatch()
+        self._watch(started)
+
+        if inner.exception() is not None:
+            job.future.set_exception(inner.exception())
+        else:
+            job.future.set_result(inner.result())
+        logger.info(f"Job {job.job_id} finished with status {job.status}")
+
+    def _prune_history(self):
+        # Drop the oldest finished jobs once the history limit is reached (called with lock held)
+        if len(self.jobs) <= self.max_history:
+            return
+        finished = [j for j in self.jobs.values() if j.future.done()]
+        finished.sort(key=lambda j: j.created_at)
+        for job in finished[:len(self.jobs) - self.max_history]:
+            del self.jobs[job.job_id]
+
+
+# Global scheduler shared by the API endpoints
+job_scheduler = JobScheduler(
+    max_workers=TRANSCRIBE_WORKERS,
+    max_queue=TRANSCRIBE_MAX_QUEUE,
+    executor=TRANSCRIBE_EXECUTOR,
+    max_history=TRANSCRIBE_JOB_HISTORY,
+    small_workers=TRANSCRIBE_SMALL_WORKERS,
+    small_models=TRANSCRIBE_SMALL_MODELS,
+)
+
+Gauge("job_queue_in_flight", "Transcription jobs queued or running", lambda: job_scheduler.active)
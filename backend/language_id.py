@@ -0,0 +1,56 @@
+import os
+import logging
+from audio_features import load_pcm, N_SAMPLES
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Language identification settings, overridable from the environment
+LANGUAGE_ID_MODEL = os.environ.get("LANGUAGE_ID_MODEL", "tiny")
+# Restrict detection to these Whisper codes, e.g. "en,vi" (empty allows every language)
+LANGUAGE_ID_CANDIDATES = [c.strip() for c in os.environ.get("LANGUAGE_ID_CANDIDATES", "").split(",") if c.strip()]
+
+# UI language choices and their Whisper codes
+LANGUAGE_CODES = {
+    "english": "en",
+    "tiếng việt": "vi",
+}
+
+
+def to_language_code(language):
+    """Map a UI language choice to a Whisper code; detected codes ("en", "fr", ...) pass through"""
+    language = language.lower()
+    if language in LANGUAGE_CODES:
+        return LANGUAGE_CODES[language]
+    return language if language.isalpha() and 2 <= len(language) <= 3 else "vi"
+
+
+def detect_language(audio_path, model_size=LANGUAGE_ID_MODEL, candidates=None):
+    """
+    Identify the spoken language from the first 30-second window with a small Whisper model.
+
+    Args:
+        audio_path: Path to the audio file
+        model_size: Model used for identification (loaded through the shared model pool)
+        candidates: Whisper codes to choose from (defaults to LANGUAGE_ID_CANDIDATES, empty = all)
+
+    Returns:
+        Tuple of (language code, probability)
+    """
+    import whisper
+    from transcription import model_pool
+
+    candidates = LANGUAGE_ID_CANDIDATES if candidates is None else candidates
+    model = model_pool.get_model(model_size)
+    audio = load_pcm(audio_path)[:N_SAMPLES]
+    mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=model.dims.n_mels)
+    # The identification model is shared with transcription jobs and streams
+    with model_pool.inference_lock(model_size):
+        _, probs = model.detect_language(mel.to(model.device, next(model.parameters()).dtype))
+
+    if candidates:
+        probs = {code: p for code, p in probs.items() if code in candidates}
+    language_code = max(probs, key=probs.get)
+    logger.info(f"Detected language {language_code} (p={probs[language_code]:.2f}) with {model_size}")
+    return language_code, float(probs[language_code])
@@ -0,0 +1,157 @@
+import os
+import logging
+import multiprocessing
+import numpy as np
+from threading import Condition
+from concurrent.futures import ProcessPoolExecutor
+from vad import detect_speech
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+# Long-audio settings, overridable from the environment
+LONG_AUDIO_WORKERS = int(os.environ.get("LONG_AUDIO_WORKERS", str(max(1, (os.cpu_count() or 2) // 4))))
+LONG_AUDIO_CHUNK_SECONDS = float(os.environ.get("LONG_AUDIO_CHUNK_SECONDS", "30"))
+LONG_AUDIO_MIN_SECONDS = float(os.environ.get("LONG_AUDIO_MIN_SECONDS", "90"))
+
+# Per-process model, set by the pool initializer
+_worker_model = None
+
+
+def split_at_silence(audio, chunk_seconds=30, sample_rate=SAMPLE_RATE):
+    """
+    Split audio into chunks of at most chunk_seconds, cutting in the middle of
+    the latest silence before each limit (hard cut when a chunk has no pause).
+
+    Returns:
+        List of (start_sample, end_sample) covering the whole recording
+    """
+    max_len = int(chunk_seconds * sample_rate)
+    if len(audio) <= max_len:
+        return [(0, len(audio))]
+
+    regions = detect_speech(audio, sample_rate)
+    # Candidate cut points: the middle of every gap between speech regions
+    cuts = [(a_end + b_start) // 2 for (_, a_end), (b_start, _) in zip(regions, regions[1:])]
+
+    chunks = []
+    start = 0
+    while len(audio) - start > max_len:
+        limit = start + max_len
+        candidates = [c for c in cuts if start < c <= limit]
+        # Avoid tiny chunks: only take a pause in the second half of the window
+        candidates = [c for c in candidates if c - start >= max_len // 2]
+        end = candidates[-1] if candidates else limit
+        chunks.append((start, end))
+        start = end
+    chunks.append((start, len(audio)))
+    return chunks
+
+
+def _init_worker(model_size, precision, threads):
+    """Load this worker's own copy of the model once, when the process starts"""
+    global _worker_model
+    import torch
+    from weight_cache import load_whisper_model
+
+    torch.set_num_threads(threads)
+    # Every worker maps the same converted-weight cache file instead of converting its own copy
+    _worker_model = load_whisper_model(model_size, device="cpu", precision=precision)
+
+
+def _transcribe_chunk(audio, language_code):
+    result = _worker_model.transcribe(
+        audio,
+        language=language_code,
+        task="transcribe",
+        condition_on_previous_text=False,
+        fp16=False,
+    )
+    return [
+        {"start": seg["start"], "end": seg["end"], "text": seg["text"].strip()}
+        for seg in result["segments"]
+    ]
+
+
+class LongAudioPool:
+    """Process pool whose workers each hold a copy of one Whisper model"""
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = None
+        self.model_key = None
+        self.users = 0  # jobs currently submitting to or waiting on the executor
+        self.cond = Condition()
+
+    def acquire_executor(self, model_size, precision="auto"):
+        """
+        Get the executor for a model, held until release_executor().
+
+        Jobs for another model wait until the current executor has no users, so it is
+        never shut down between another job's get and its submits.
+        """
+        with self.cond:
+            while self.executor is not None and self.model_key != (model_size, precision) and self.users > 0:
+                self.cond.wait()
+            self.users += 1
+            if self.executor is not None and self.model_key == (model_size, precision):
+                return self.executor
+            if self.executor is not None:
+                logger.info(f"Restarting long-audio workers for {model_size}")
+                self.executor.shutdown(wait=True)
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(model_size, precision, threads),
+            )
+            self.model_key = (model_size, precision)
+            return self.executor
+
+    def release_executor(self):
+        with self.cond:
+            self.users -= 1
+            self.cond.notify_all()
+
+    def transcribe(self, audio, model_size, language_code, precision="auto"):
+        """
+        Transcribe a long recording chunk-parallel across the worker processes.
+
+        Args:
+            audio: 16 kHz float32 samples
+            model_size: Whisper model name (as passed to whisper.load_model)
+            language_code: Whisper language code
+            precision: Precision variant the workers load
+
+        Returns:
+            Tuple of (text, segments with timestamps on the original timeline)
+        """
+        chunks = split_at_silence(audio, LONG_AUDIO_CHUNK_SECONDS)
+        logger.info(f"Transcribing {len(audio) / SAMPLE_RATE:.0f}s in {len(chunks)} chunks on {self.workers} workers")
+
+        executor = self.acquire_executor(model_size, precision)
+        try:
+            futures = [
+                executor.submit(_transcribe_chunk, np.ascontiguousarray(audio[start:end]), language_code)
+                for start, end in chunks
+            ]
+
+            # Stitch chunk results back together in order
+            segments = []
+            for (start, _), future in zip(chunks, futures):
+                offset = start / SAMPLE_RATE
+                for seg in future.result():
+                    seg["start"] = round(seg["start"] + offset, 2)
+                    seg["end"] = round(seg["end"] + offset, 2)
+                    segments.append(seg)
+        finally:
+            self.release_executor()
+        text = " ".join(seg["text"] for seg in segments if seg["text"])
+        return text, segments
+
+
+long_audio_pool = LongAudioPool(LONG_AUDIO_WORKERS)
@@ -1,17 +1,36 @@
-from fastapi import FastAPI, Form ,UploadFile, File, HTTPException
+from fastapi import FastAPI, Form ,UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import os
+import hashlib
 import shutil
+import anyio
 from datetime import datetime
 import logging
-from transcription import transcribe_with_pool, save_transcription
-from hf_transcription import transcribe_with_hf
+from transcription import save_transcription, model_pool, get_device
+from hf_transcription import hf_model_pool
+from engines import ENGINES, get_engine, engine_router
 from pydantic import BaseModel
+from typing import List, Optional
 import time
-import torch
-import subprocess
-from model_preload import preload_model
+import json
+import asyncio
+import numpy as np
+from contextlib import asynccontextmanager
+from model_preload import preload_model, warm_up_models, warmup_state
+from memory_utils import process_memory
+from metrics import render_metrics, UPLOAD_STAGE_SECONDS, TRANSCRIPTION_STAGE_SECONDS
+from precision import check_precision, PRECISIONS
+from audio_features import prepare_audio, pcm_duration, StreamingPCMDecoder
+from job_queue import job_scheduler, QueueFullError, PRIORITIES
+from streaming import WebmStreamDecoder, STREAM_MAX_SESSIONS
+from transcription_cache import TranscriptionCache, audio_hash, write_hash_sidecar, make_cache_key, CACHE_MEMORY_ENTRIES, CACHE_DISK_BYTES
+from batch_transcribe import transcription_settings, write_transcription_meta, find_sessions, run_batch
+from session_index import SessionIndex, SESSION_RETENTION_DAYS, SESSION_SWEEP_INTERVAL_HOURS
+from output_formats import OUTPUT_FORMATS, render, save_segments, load_segments
+from speculative import draft_compatible, whisper_draft_model, hf_draft_compatible, HF_DRAFT_MODEL_ID, HF_DRAFT_TARGETS
+from language_id import detect_language, to_language_code, LANGUAGE_ID_MODEL, LANGUAGE_ID_CANDIDATES
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -19,7 +38,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Speech-to-Text API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up the configured models in the background; /api/ready turns 200 when done"""
+    warmup_task = asyncio.create_task(asyncio.to_thread(warm_up_models))
+    # Register sessions recorded before the index existed
+    await asyncio.to_thread(session_index.backfill)
+    # Retention is server configuration only; no request can delete sessions in bulk
+    sweep_task = asyncio.create_task(sweep_sessions_periodically()) if SESSION_RETENTION_DAYS > 0 else None
+    yield
+    warmup_task.cancel()
+    if sweep_task is not None:
+        sweep_task.cancel()
+    job_scheduler.shutdown(wait=False)
+
+app = FastAPI(title="Speech-to-Text API", lifespan=lifespan)
 
 # Configure CORS to allow requests from the frontend
 app.add_middleware(
@@ -36,6 +69,19 @@ STORAGE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "storage")
 # Create storage directory if it doesn't exist
 os.makedirs(STORAGE_DIR, exist_ok=True)
 
+# Content-addressed cache of finished transcriptions
+transcription_cache = TranscriptionCache(
+    os.path.join(STORAGE_DIR, "_cache"),
+    max_memory_entries=CACHE_MEMORY_ENTRIES,
+    max_disk_bytes=CACHE_DISK_BYTES,
+)
+
+# Index of sessions and their metadata, so lookups do not walk STORAGE_DIR
+session_index = SessionIndex(STORAGE_DIR)
+
+# Streams run inference on threads rather than the job scheduler, so they are admitted here
+stream_slots = asyncio.Semaphore(STREAM_MAX_SESSIONS)
+
 # Serve the frontend static files
 app.mount("/app", StaticFiles(directory="frontend", html=True), name="frontend")
 
@@ -47,6 +93,57 @@ def health_check():
     """Health check endpoint to verify the API is running."""
     return {"status": "ok"}
 
+@app.get("/api/ready")
+def readiness_check():
+    """Readiness endpoint: 503 until the startup model warm-up has finished, or if it failed."""
+    if warmup_state["error"] is not None:
+        raise HTTPException(status_code=503, detail=f"Model warm-up failed: {warmup_state['error']}")
+    if not warmup_state["ready"]:
+        raise HTTPException(status_code=503, detail="Models are still warming up")
+    return {"status": "ready", **warmup_state}
+
+def create_session_dir(language=None):
+    """
+    Create a STORAGE_DIR/YYYY-MM-DD/HHMMSS session directory and register it in the session index
+
+    Uploads within the same second get a -1, -2, ... suffix instead of sharing a folder.
+
+    Returns:
+        (date, session, path, session_id)
+    """
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    timestamp = now.strftime("%H%M%S")
+
+    date_dir = os.path.join(STORAGE_DIR, today)
+    os.makedirs(date_dir, exist_ok=True)
+
+    session_folder = timestamp
+    suffix = 0
+    while True:
+        session_dir = os.path.join(date_dir, session_folder)
+        try:
+            os.makedirs(session_dir)
+            break
+        except FileExistsError:
+            suffix += 1
+            session_folder = f"{timestamp}-{suffix}"
+
+    session_id = session_index.create(today, session_folder, language.lower() if language else None, now.timestamp())
+    return today, session_folder, session_dir, session_id
+
+def record_upload(session_id, audio_path, digest, upload_start):
+    """Store the hash, duration and upload time of a freshly uploaded session"""
+    session_index.update(
+        session_id,
+        audio_sha256=digest,
+        duration=pcm_duration(audio_path),
+        upload_seconds=time.time() - upload_start,
+    )
+
+# Read size for upload bodies
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
 @app.post("/api/upload-audio")
 async def upload_audio(file: UploadFile = File(...), language: str =Form("tiếng việt") ):
     """
@@ -63,28 +160,38 @@ async def upload_audio(file: UploadFile = File(...), language: str =Form("tiến
         logger.info(f"Language being chosen: {language}")
         
         # Validate language
-        if language.lower() not in ["english", "tiếng việt"]:
+        if language.lower() not in ["english", "tiếng việt", "auto"]:
             raise HTTPException(status_code=400, detail="Unsupported language")
             
         # Create directory structure based on date and time
-        today = datetime.now().strftime("%Y-%m-%d")
-        timestamp = datetime.now().strftime("%H%M%S")
-        
-        date_dir = os.path.join(STORAGE_DIR, today)
-        session_dir = os.path.join(date_dir, timestamp)
-        
-        os.makedirs(session_dir, exist_ok=True)
+        upload_start = time.time()
+        today, timestamp, session_dir, session_id = create_session_dir(language)
         
         # Save the audio file
         audio_path = os.path.join(session_dir, "audio.webm")
-        with open(audio_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        digest = hashlib.sha256()
+        with UPLOAD_STAGE_SECONDS.time(stage="write"):
+            with open(audio_path, "wb") as buffer:
+                for chunk in iter(lambda: file.file.read(UPLOAD_CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    buffer.write(chunk)
+        # Hash while copying so the transcription cache does not re-read the file
+        write_hash_sidecar(audio_path, digest.hexdigest())
             
         logger.info(f"Audio file uploaded successfully")
+
+        # Decode to PCM once so every model and retry can skip ffmpeg
+        try:
+            with UPLOAD_STAGE_SECONDS.time(stage="decode_pcm"):
+                await asyncio.to_thread(prepare_audio, audio_path)
+        except Exception as e:
+            logger.warning(f"Could not pre-decode {audio_path}, transcription will decode it: {str(e)}")
         # logger.info(f"Language being chosen: {language}")
+        record_upload(session_id, audio_path, digest.hexdigest(), upload_start)
         
         return {
             "message": "Audio file uploaded successfully",
+            "session_id": session_id,
             "date_folder": today,
             "session_folder": timestamp,
             "file_path": audio_path,
@@ -94,13 +201,370 @@ async def upload_audio(file: UploadFile = File(...), language: str =Form("tiến
     except Exception as e:
         logger.error(f"Error uploading audio: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+@app.post("/api/upload-audio-stream")
+async def upload_audio_stream(request: Request, language: str = "tiếng việt"):
+    """
+    Endpoint to upload audio as a raw streamed request body
+    
+    The body is written to disk in chunks as it arrives while being hashed and
+    piped into ffmpeg, so the PCM decode finishes shortly after the last byte
+    instead of starting after the whole file was buffered.
+    
+    Args:
+        request: The request whose body is the audio (e.g. audio/webm)
+        language: The language of the audio (query parameter)
+    
+    Returns:
+        Dict with the storage path information, same as /api/upload-audio
+    """
+    # Validate language
+    if language.lower() not in ["english", "tiếng việt", "auto"]:
+        raise HTTPException(status_code=400, detail="Unsupported language")
+
+    upload_start = time.time()
+    today, timestamp, session_dir, session_id = create_session_dir(language)
+    audio_path = os.path.join(session_dir, "audio.webm")
+    digest = hashlib.sha256()
+    decoder = StreamingPCMDecoder()
+
+    try:
+        with UPLOAD_STAGE_SECONDS.time(stage="stream"):
+            await decoder.start()
+            async with await anyio.open_file(audio_path, "wb") as buffer:
+                async for chunk in request.stream():
+                    if not chunk:
+                        continue
+                    digest.update(chunk)
+                    await buffer.write(chunk)
+                    await decoder.feed(chunk)
+        write_hash_sidecar(audio_path, digest.hexdigest())
+    except Exception as e:
+        decoder.abort()
+        logger.error(f"Error uploading audio: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    try:
+        with UPLOAD_STAGE_SECONDS.time(stage="decode_pcm"):
+            await decoder.finish(audio_path)
+    except Exception as e:
+        logger.warning(f"Streaming decode of {audio_path} failed, decoding the file instead: {str(e)}")
+        try:
+            await asyncio.to_thread(prepare_audio, audio_path)
+        except Exception as e:
+            logger.warning(f"Could not pre-decode {audio_path}, transcription will decode it: {str(e)}")
+
+    record_upload(session_id, audio_path, digest.hexdigest(), upload_start)
+
+    logger.info("Audio stream uploaded successfully")
+    return {
+        "message": "Audio file uploaded successfully",
+        "session_id": session_id,
+        "date_folder": today,
+        "session_folder": timestamp,
+        "file_path": audio_path,
+        "language": language
+    }
+
+# Whisper model sizes accepted by the API
+WHISPER_MODEL_SIZES = get_engine("whisper").models
+
 # Define request models for validation
 class TranscriptionRequest(BaseModel):
-    date_folder: str
-    session_folder: str
+    session_id: Optional[str] = None  # Either the session ID returned by the upload...
+    date_folder: Optional[str] = None  # ...or its storage folders
+    session_folder: Optional[str] = None
     language: str = "tiếng việt"
     model_size: str = "turbo"  # Changed default to turbo
     use_hf_model: bool = False
+    backend: Optional[str] = None  # Any registered engine, or "auto" for the fastest one at least as accurate as model_size
+    use_vad: bool = False  # Skip silence with the energy VAD before decoding
+    long_audio: bool = False  # Split long recordings across worker processes
+    precision: str = "auto"  # auto, fp32, bf16 (hf backend only) or int8 (dynamic quantization, CPU only)
+    assisted: bool = False  # Speculative decoding: a small draft model proposes tokens the main model verifies (whisper: clips up to 30 s, one untimed segment, no temperature fallback; hf: large-v3 only)
+    output_format: str = "text"  # text, json, srt or vtt (returned as "output")
+    priority: str = "interactive"  # interactive, normal or batch
+    deadline_seconds: Optional[float] = None  # Wanted within this many seconds of submission
+    allow_fallback: bool = False  # Use a smaller model size if the deadline cannot be met otherwise
+
+class BatchTranscriptionRequest(BaseModel):
+    date_folder: Optional[str] = None  # Transcribe every session of this day
+    sessions: List[str] = []  # And/or explicit "YYYY-MM-DD/HHMMSS" sessions
+    language: str = "tiếng việt"
+    model_size: str = "turbo"
+    use_hf_model: bool = False
+    backend: Optional[str] = None
+    use_vad: bool = False
+    long_audio: bool = False
+    precision: str = "auto"
+    assisted: bool = False
+    force: bool = False  # Re-transcribe sessions whose transcription.txt is already current
+    concurrency: int = 2  # Sessions in flight at once
+
+def run_transcription(audio_path, transcription_path, language, model_size, use_hf_model, use_vad=False, long_audio=False, precision="auto", output_format="text", assisted=False, backend=None, requested_backend=None):
+    """
+    Run a transcription job and save the result (executed inside the worker pool)
+
+    Args:
+        audio_path: Path to the audio file to transcribe
+        transcription_path: Where to write the transcription text
+        language: The language of the audio, or "auto" to detect it with a small model first
+        model_size: Whisper model size for the standard backend
+        use_hf_model: Whether to use the HuggingFace backend (when backend is not given)
+        use_vad: Whether to transcribe only the detected speech regions
+        long_audio: Whether to split long recordings across worker processes
+        precision: Model precision variant to run
+        output_format: Also render the result as "json", "srt" or "vtt" in the response
+        assisted: Whether to decode with a draft model (speculative decoding)
+        backend: Name of the registered engine to run
+        requested_backend: The backend asked for, recorded for batch runs ("auto" when routed)
+
+    Returns:
+        Dict with the transcription, its segments and file paths
+    """
+    start_time = time.time()
+    audio_sha256 = audio_hash(audio_path)
+    requested_language = language
+    if language.lower() == "auto":
+        language = resolve_language(audio_path, audio_sha256)
+
+    engine = get_engine(backend or request_backend(use_hf_model))
+    backend, model = engine.name, engine.resolve_model(model_size)
+
+    # Look up a previous result for the same audio, backend, model and language
+    cache_key = make_cache_key(audio_sha256, backend, model, language, vad=use_vad, long=long_audio and engine.supports_long_audio, precision=precision if precision != "auto" else None, assisted=assisted)
+    cached = transcription_cache.get(cache_key)
+    # Entries cached before segments were stored are transcribed again
+    if cached is not None and "segments" not in cached:
+        cached = None
+
+    inference_seconds = None
+    if cached is not None:
+        logger.info(f"Transcription cache hit for {audio_path}")
+        transcription, segments = cached["transcription"], cached["segments"]
+    # Transcribe the audio
+    else:
+        logger.info(f"Using the {backend} engine with model '{model}' for transcription")
+        # Decode time only: a first-use model load would otherwise count as slow inference
+        timings = {}
+        transcription, segments = engine.transcribe(audio_path, language, model, use_vad=use_vad, long_audio=long_audio, precision=precision, assisted=assisted, timings=timings)
+        inference_seconds = timings.get("inference")
+        # Measured throughput drives backend="auto" routing
+        if inference_seconds is not None:
+            engine_router.observe(backend, model, pcm_duration(audio_path), inference_seconds)
+    end_time = time.time()
+    # Save the transcription
+    duration = end_time - start_time
+    logger.info(f"Transcription took {duration:.6f} seconds")
+
+    if cached is None:
+        transcription_cache.put(cache_key, {"transcription": transcription, "segments": segments})
+    save_transcription(transcription, transcription_path)
+    # One inference pass serves every output format from the stored segments
+    save_segments(transcription_path, transcription, segments)
+    session = session_index.find_by_dir(os.path.dirname(transcription_path))
+    if session is not None:
+        session_index.update(
+            session["session_id"],
+            language=language.lower(),
+            backend=backend,
+            model=model,
+            audio_sha256=audio_sha256,
+            transcription_seconds=duration,
+            transcribed_at=end_time,
+        )
+    # Lets batch runs skip sessions that are already transcribed with these settings
+    write_transcription_meta(transcription_path, transcription_settings(requested_language, model_size, use_hf_model, use_vad, long_audio, precision, assisted, requested_backend or backend), audio_sha256)
+
+    result = {
+        "message": "Transcription completed successfully",
+        "transcription": transcription,
+        "segments": segments,
+        "language": language,
+        "backend": backend,
+        "model": model,
+        "audio_path": audio_path,
+        "transcription_path": transcription_path,
+        "cached": cached is not None,
+        "inference_seconds": inference_seconds,  # None on a cache hit; feeds the scheduler's runtime estimates
+    }
+    if output_format != "text":
+        result["output"] = render(transcription, segments, output_format)
+    return result
+
+def request_backend(use_hf_model, backend=None):
+    """The backend a request asked for: backend if given, else the one selected by use_hf_model"""
+    return backend or ("hf" if use_hf_model else "whisper")
+
+def route_request(backend, model_size, language, audio_seconds, long_audio=False, precision="auto"):
+    """
+    Resolve a requested backend to (engine name, model)
+
+    "auto" picks the fastest registered engine and model, at least as accurate as
+    model_size, for the audio length and language, from measured throughput.
+    """
+    if backend != "auto":
+        engine = get_engine(backend)
+        return engine.name, engine.resolve_model(model_size)
+    language_code = None if language.lower() == "auto" else to_language_code(language)
+    return engine_router.route(model_size, audio_seconds, language_code, long_audio, precision)
+
+def resolve_language(audio_path, audio_sha256):
+    """Detect the language of an audio file, cached per audio hash so it only runs once"""
+    key = make_cache_key(audio_sha256, "language-id", LANGUAGE_ID_MODEL, "auto", candidates=",".join(LANGUAGE_ID_CANDIDATES))
+    cached = transcription_cache.get(key)
+    if cached is not None:
+        return cached["language"]
+
+    with TRANSCRIPTION_STAGE_SECONDS.time(stage="language_id", backend="whisper", model=LANGUAGE_ID_MODEL, language="auto"):
+        language_code, probability = detect_language(audio_path)
+    transcription_cache.put(key, {"language": language_code, "probability": probability})
+    return language_code
+
+async def submit_batch_job(audio_path, transcription_path, language, model_size, use_hf_model, use_vad=False, long_audio=False, precision="auto", assisted=False, requested_backend="whisper"):
+    """Transcribe a stored session through the shared job scheduler at batch priority"""
+    audio_seconds = pcm_duration(audio_path)
+    backend, model = route_request(requested_backend, model_size, language, audio_seconds, long_audio, precision)
+    # Share the worker pool with interactive requests, backing off while its queue is full
+    while True:
+        try:
+            # Batch work yields to interactive requests and may only fill half the queue
+            job = job_scheduler.submit_job(
+                run_transcription,
+                (audio_path, transcription_path, language, model, use_hf_model, use_vad, long_audio, precision),
+                {"assisted": assisted, "backend": backend, "requested_backend": requested_backend},
+                priority="batch",
+                model_size=model if backend == "whisper" else None,
+                audio_seconds=audio_seconds,
+            )
+            break
+        except QueueFullError:
+            await asyncio.sleep(1)
+    return await job_scheduler.wait(job)
+
+def validate_transcription_settings(request):
+    """Validate the language, model size and precision shared by single and batch requests"""
+    # Validate language
+    if request.language.lower() not in ["english", "tiếng việt", "auto"]:
+        raise HTTPException(status_code=400, detail="Unsupported language")
+
+    # Validate the backend, and the model size against the engine's models ("auto" treats it as the accuracy floor)
+    backend = request_backend(request.use_hf_model, request.backend)
+    if backend != "auto" and backend not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Invalid backend. Choose from: {', '.join(list(ENGINES) + ['auto'])}")
+    if backend != "auto" and not ENGINES[backend].available():
+        raise HTTPException(status_code=400, detail=f"The {backend} backend is not installed on this server")
+    try:
+        get_engine("whisper" if backend == "auto" else backend).resolve_model(request.model_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # The whisper draft model must share the mel bins and vocabulary of the model it assists
+    if request.assisted and backend == "whisper" and draft_compatible(request.model_size) is False:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No draft model can assist {request.model_size} (draft: {whisper_draft_model(request.model_size)}; set WHISPER_DRAFT_MODEL to a compatible model)",
+        )
+    # The hf draft reuses the main model's encoder, so it only assists the model it was distilled from
+    if request.assisted and backend == "hf" and not hf_draft_compatible(get_engine("hf").resolve_model(request.model_size)):
+        raise HTTPException(
+            status_code=400,
+            detail=f"{HF_DRAFT_MODEL_ID} can only assist {', '.join(HF_DRAFT_TARGETS)} on the hf backend (request model_size large-v3)",
+        )
+
+    # Validate precision (int8 is CPU-only, bf16 only runs on the hf backend)
+    if backend == "auto":
+        precisions = {p for engine in ENGINES.values() if engine.available() for p in engine.precisions}
+        precisions = [p for p in PRECISIONS if p in precisions]
+    else:
+        precisions = ENGINES[backend].precisions
+    try:
+        check_precision(request.precision, get_device(), precisions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def choose_model_size(model_size, audio_seconds, deadline_seconds, priority):
+    """Largest model size, up to the requested one, expected to finish within the deadline"""
+    factors = job_scheduler.realtime_factors
+    requested = model_size.lower()
+    smaller = sorted(
+        (m for m in WHISPER_MODEL_SIZES if m != requested and factors.get(m, 1.0) < factors.get(requested, 1.0)),
+        key=lambda m: factors.get(m, 1.0),
+        reverse=True,
+    )
+    candidates = [requested] + smaller
+    for candidate in candidates:
+        if job_scheduler.estimate_completion(candidate, audio_seconds, priority) <= deadline_seconds:
+            return candidate
+    # Nothing fits: the fastest model gets closest to the deadline
+    return candidates[-1]
+
+def submit_transcription(request: TranscriptionRequest):
+    """Validate a TranscriptionRequest and schedule it on the worker pool"""
+    validate_transcription_settings(request)
+
+    if request.output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid output format. Choose from: {', '.join(OUTPUT_FORMATS)}")
+    if request.priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"Invalid priority. Choose from: {', '.join(PRIORITIES)}")
+
+    # Resolve the session's folders
+    if request.session_id:
+        session = session_index.get(request.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found")
+        date_folder, session_folder = session["date_folder"], session["session_folder"]
+    elif request.date_folder and request.session_folder:
+        date_folder, session_folder = request.date_folder, request.session_folder
+        session = session_index.find(date_folder, session_folder)
+    else:
+        raise HTTPException(status_code=400, detail="Provide a session_id or date_folder and session_folder")
+
+    # Construct the path to the audio file
+    session_dir = os.path.join(STORAGE_DIR, date_folder, session_folder)
+    audio_path = os.path.join(session_dir, "audio.webm")
+
+    # Check if audio file exists
+    if not os.path.exists(audio_path):
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+    transcription_path = os.path.join(session_dir, "transcription.txt")
+    audio_seconds = (session or {}).get("duration") or pcm_duration(audio_path)
+    requested_backend = request_backend(request.use_hf_model, request.backend)
+    backend, model = route_request(requested_backend, request.model_size, request.language, audio_seconds, request.long_audio, request.precision)
+    # The scheduler's realtime factors and small-model slots are per whisper model size
+    model_size = model if backend == "whisper" else None
+    deadline = None
+    if request.deadline_seconds is not None:
+        deadline = time.time() + request.deadline_seconds
+        if request.allow_fallback and model_size is not None:
+            chosen = choose_model_size(model_size, audio_seconds, request.deadline_seconds, request.priority)
+            if chosen != model_size:
+                logger.info(f"Falling back from {model_size} to {chosen} to meet a {request.deadline_seconds}s deadline")
+                model_size = chosen
+
+    try:
+        return job_scheduler.submit_job(
+            run_transcription,
+            (
+                audio_path,
+                transcription_path,
+                request.language,
+                model_size or request.model_size,
+                request.use_hf_model,
+                request.use_vad,
+                request.long_audio,
+                request.precision,
+                request.output_format,
+                request.assisted,
+            ),
+            {"backend": backend, "requested_backend": requested_backend},
+            priority=request.priority,
+            deadline=deadline,
+            model_size=model_size,
+            audio_seconds=audio_seconds,
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
 
 @app.post("/api/transcribe")
 async def transcribe(request: TranscriptionRequest):
@@ -114,49 +578,277 @@ async def transcribe(request: TranscriptionRequest):
         Dict with the transcription and file paths
     """
     try:
-        # Validate language
-        if request.language.lower() not in ["english", "tiếng việt"]:
-            raise HTTPException(status_code=400, detail="Unsupported language")
-             
-        # Validate model size if not using HuggingFace model
-        if not request.use_hf_model:
-            valid_model_sizes = ["tiny", "base", "small", "medium", "large-v3", "turbo"]
-            if request.model_size.lower() not in valid_model_sizes:
-                raise HTTPException(status_code=400, detail=f"Invalid model size. Choose from: {', '.join(valid_model_sizes)}")
-        
-        # Construct the path to the audio file
-        session_dir = os.path.join(STORAGE_DIR, request.date_folder, request.session_folder)
-        audio_path = os.path.join(session_dir, "audio.webm")
-        
-        # Check if audio file exists
-        if not os.path.exists(audio_path):
-            raise HTTPException(status_code=404, detail="Audio file not found")
-        start_time = time.time()
-        # Transcribe the audio
-        if request.use_hf_model:
-            logger.info("Using HuggingFace Whisper model for transcription")
-            transcription = transcribe_with_hf(audio_path, request.language)
-        else:
-            logger.info(f"Using standard Whisper model '{request.model_size}' for transcription")
-            transcription = transcribe_with_pool(audio_path, request.language, request.model_size)
-        end_time = time.time()
-        # Save the transcription
-        duration = end_time - start_time
-        logger.info(f"Transcription took {duration:.6f} seconds")
+        job = submit_transcription(request)
+        # Wait for the worker without blocking the event loop
+        return await job_scheduler.wait(job)
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error during transcription: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/batch-transcribe")
+async def batch_transcribe(request: BatchTranscriptionRequest):
+    """
+    Endpoint to transcribe a whole date folder and/or a list of sessions
+    
+    Args:
+        request: The BatchTranscriptionRequest with the sessions and settings
+    
+    Returns:
+        Newline-delimited JSON progress events, one per session, then a summary
+    """
+    validate_transcription_settings(request)
+    if not request.date_folder and not request.sessions:
+        raise HTTPException(status_code=400, detail="Provide a date_folder or a list of sessions")
+    if request.concurrency < 1:
+        raise HTTPException(status_code=400, detail="concurrency must be at least 1")
+
+    sessions = find_sessions(STORAGE_DIR, request.date_folder, request.sessions, session_index)
+    requested_backend = request_backend(request.use_hf_model, request.backend)
+    settings = transcription_settings(request.language, request.model_size, request.use_hf_model, request.use_vad, request.long_audio, request.precision, request.assisted, requested_backend)
+
+    async def submit(audio_path, transcription_path):
+        return await submit_batch_job(
+            audio_path, transcription_path, request.language, request.model_size, request.use_hf_model,
+            request.use_vad, request.long_audio, request.precision, request.assisted, requested_backend,
+        )
+
+    async def progress():
+        async for event in run_batch(STORAGE_DIR, sessions, settings, submit, request.concurrency, request.force):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+@app.post("/api/jobs")
+async def create_job(request: TranscriptionRequest):
+    """
+    Endpoint to queue a transcription job and return immediately
+    
+    Args:
+        request: The TranscriptionRequest containing path and settings
+    
+    Returns:
+        Dict with the job ID and its initial status
+    """
+    job = submit_transcription(request)
+    return {"job_id": job.job_id, "status": job.status}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Endpoint to poll a transcription job
+    
+    Args:
+        job_id: The ID returned by /api/jobs
+    
+    Returns:
+        Dict with the job status, and the result or error once finished
+    """
+    job = job_scheduler.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/api/jobs")
+async def job_stats():
+    """Report worker pool occupancy and queue depth"""
+    return job_scheduler.stats()
+
+@app.websocket("/ws/transcribe")
+async def transcribe_stream(websocket: WebSocket):
+    """
+    Streaming transcription over a WebSocket
+
+    Protocol:
+        1. Client sends a JSON config: {"language": ..., "model_size": ..., "format": "webm" | "pcm_f32le"}
+        2. Client sends binary audio chunks (MediaRecorder webm, or raw 16 kHz mono float32 PCM)
+        3. Server pushes {"type": "partial", "text"} and {"type": "final", "segments"} messages
+        4. Client sends {"type": "end"}; server replies {"type": "done", ...} and saves the session
+    """
+    await websocket.accept()
+    if stream_slots.locked():
+        await websocket.send_json({"type": "error", "detail": f"Too many concurrent streams (limit {STREAM_MAX_SESSIONS}), try again later"})
+        await websocket.close(code=1013)
+        return
+    await stream_slots.acquire()
+    decoder = None
+    try:
+        config = await websocket.receive_json()
+        language = config.get("language", "tiếng việt")
+        model_size = config.get("model_size", "turbo")
+        audio_format = config.get("format", "webm")
+        engine = ENGINES.get(config.get("backend", "whisper"))
+
+        if language.lower() not in ["english", "tiếng việt"]:
+            await websocket.send_json({"type": "error", "detail": "Unsupported language"})
+            await websocket.close()
+            return
+        if engine is None or not engine.supports_streaming:
+            await websocket.send_json({"type": "error", "detail": f"Streaming backends: {', '.join(n for n, e in ENGINES.items() if e.supports_streaming)}"})
+            await websocket.close()
+            return
+        try:
+            model_size = engine.resolve_model(model_size)
+        except ValueError:
+            await websocket.send_json({"type": "error", "detail": "Invalid model size"})
+            await websocket.close()
+            return
+        if audio_format not in ["webm", "pcm_f32le"]:
+            await websocket.send_json({"type": "error", "detail": "Unsupported audio format"})
+            await websocket.close()
+            return
+
+        today, timestamp, session_dir, session_id = create_session_dir(language)
+        decoder = WebmStreamDecoder(os.path.join(session_dir, "audio.webm")) if audio_format == "webm" else None
+        # Stream state lives in this process, so inference runs on a thread rather than the job pool
+        stream = await asyncio.to_thread(engine.stream, language, model_size)
+        await websocket.send_json({"type": "ready", "session_id": session_id, "date_folder": today, "session_folder": timestamp})
+
+        async def run_step(final=False):
+            committed, partial = await asyncio.to_thread(stream.process, final)
+            if committed:
+                await websocket.send_json({"type": "final", "segments": committed})
+            if partial:
+                await websocket.send_json({"type": "partial", "text": partial})
+
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                if decoder is not None:
+                    # Only the new chunk is decoded, by the session's ffmpeg process
+                    await asyncio.to_thread(decoder.append, message["bytes"])
+                    stream.insert_audio(decoder.decode_new())
+                else:
+                    stream.insert_audio(np.frombuffer(message["bytes"], dtype=np.float32))
+                if stream.ready():
+                    await run_step()
+            elif message.get("text") and json.loads(message["text"]).get("type") == "end":
+                if decoder is not None:
+                    stream.insert_audio(await asyncio.to_thread(decoder.finish))
+                await run_step(final=True)
+                break
+
+        transcription = stream.text()
         transcription_path = os.path.join(session_dir, "transcription.txt")
         save_transcription(transcription, transcription_path)
-        
-        return {
-            "message": "Transcription completed successfully",
+        save_segments(transcription_path, transcription, stream.finalized)
+        session_index.update(session_id, backend=engine.name, model=model_size, duration=stream.duration(), transcribed_at=time.time())
+        await websocket.send_json({
+            "type": "done",
+            "session_id": session_id,
             "transcription": transcription,
-            "audio_path": audio_path,
+            "date_folder": today,
+            "session_folder": timestamp,
             "transcription_path": transcription_path
-        }
-        
+        })
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        logger.info("Streaming client disconnected")
     except Exception as e:
-        logger.error(f"Error during transcription: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Error during streaming transcription: {str(e)}")
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close()
+    finally:
+        if decoder is not None:
+            decoder.abort()
+        stream_slots.release()
+
+@app.get("/api/sessions")
+def list_sessions(date_folder: Optional[str] = None, language: Optional[str] = None, before: Optional[float] = None, limit: int = 50):
+    """
+    List sessions newest first from the session index
+    
+    Args:
+        date_folder: Only sessions of this day
+        language: Only sessions in this language
+        before: Only sessions created before this timestamp (pass the last created_at to page)
+        limit: Maximum number of sessions
+    """
+    return {"sessions": session_index.list(date_folder, language, before, min(limit, 500)), **session_index.stats()}
+
+@app.get("/api/sessions/{session_id}")
+def get_session(session_id: str):
+    """Metadata of one session"""
+    session = session_index.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+@app.get("/api/sessions/{session_id}/transcript")
+def get_transcript(session_id: str, format: str = "text"):
+    """
+    Serve a stored transcription in any output format without re-running the model
+    
+    Args:
+        session_id: The session to read
+        format: "text", "json", "srt" or "vtt"
+    """
+    if format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid output format. Choose from: {', '.join(OUTPUT_FORMATS)}")
+    session = session_index.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    transcription_path = os.path.join(STORAGE_DIR, session["date_folder"], session["session_folder"], "transcription.txt")
+    stored = load_segments(transcription_path)
+    if stored is None:
+        if format != "text" or not os.path.exists(transcription_path):
+            raise HTTPException(status_code=404, detail="No stored segments for this session; transcribe it again")
+        with open(transcription_path, "r", encoding="utf-8") as f:
+            stored = {"text": f.read(), "segments": []}
+    return PlainTextResponse(render(stored["text"], stored["segments"], format), media_type=OUTPUT_FORMATS[format])
+
+def sweep_sessions():
+    """Delete sessions older than SESSION_RETENTION_DAYS, files and index entries"""
+    days = SESSION_RETENTION_DAYS
+    if days <= 0:
+        return []
+
+    removed = []
+    for session in session_index.expired(days * 86400):
+        shutil.rmtree(os.path.join(STORAGE_DIR, session["date_folder"], session["session_folder"]), ignore_errors=True)
+        session_index.delete(session["session_id"])
+        removed.append(session["session_id"])
+    logger.info(f"Retention sweep removed {len(removed)} sessions older than {days} days")
+    return removed
+
+async def sweep_sessions_periodically():
+    """Run the retention sweep at startup and then every SESSION_SWEEP_INTERVAL_HOURS"""
+    while True:
+        try:
+            await asyncio.to_thread(sweep_sessions)
+        except Exception as e:
+            logger.error(f"Retention sweep failed: {str(e)}")
+        await asyncio.sleep(max(SESSION_SWEEP_INTERVAL_HOURS, 0.01) * 3600)
+
+@app.get("/api/models")
+async def model_stats():
+    """Report model pool occupancy against the memory budgets"""
+    return {
+        "whisper": model_pool.stats(),
+        "hf": hf_model_pool.stats(),
+        "process": process_memory()
+    }
+
+@app.get("/api/engines")
+async def engine_stats():
+    """Report the registered engines, their models and the measured speed that backend=auto routes by"""
+    return engine_router.stats()
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text-format metrics for stage latencies, queue wait and pool activity (this process only)"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Report transcription cache hit/miss counters"""
+    return transcription_cache.stats()
 
 # We will add more endpoints for speech-to-text conversion later
 
@@ -168,7 +860,7 @@ async def preload_model_endpoint():
         # Preload all models
         logger.info("Preloading models at startup...")
         from model_preload import preload_all_models
-        preload_all_models()
+        await asyncio.to_thread(preload_all_models)
         end_time = time.time()
         duration = end_time - start_time
         return {"message": f"Models preloaded successfully in {duration:.3f} seconds"}
@@ -178,5 +870,6 @@ async def preload_model_endpoint():
 if __name__ == "__main__":
     import uvicorn
     # Set number of workers to 1 to avoid model duplication
+    # (serve.py runs several workers that share one copy of the weights)
     # Set timeout to accommodate longer processing times
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=False, workers=1, timeout_keep_alive=120) 
\ No newline at end of file
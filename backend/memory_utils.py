@@ -0,0 +1,113 @@
+import os
+import sys
+import gc
+import logging
+import resource
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Approximate parameter counts, used to make room before a Whisper model is loaded
+WHISPER_PARAM_COUNTS = {
+    "tiny": 39_000_000,
+    "base": 74_000_000,
+    "small": 244_000_000,
+    "medium": 769_000_000,
+    "large-v3": 1_550_000_000,
+    "large-v3-turbo": 809_000_000,
+}
+
+# Default share of RAM (or VRAM on CUDA) for each model pool. Both pools live in the
+# same process, so together they leave a third of memory for activations and the OS
+WHISPER_POOL_FRACTION = 0.4
+HF_POOL_FRACTION = 0.25
+
+
+def module_footprint(module):
+    """Bytes held by a torch module's weights, including packed int8 layers"""
+    import torch
+
+    total = 0
+    seen = set()
+    # state_dict also covers quantized layers, whose packed weights are not parameters
+    for value in module.state_dict(keep_vars=True).values():
+        tensors = value if isinstance(value, tuple) else (value,)
+        for tensor in tensors:
+            if not isinstance(tensor, torch.Tensor) or id(tensor) in seen:
+                continue
+            seen.add(id(tensor))
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def estimate_whisper_footprint(model_size, bytes_per_param=4):
+    """Estimated bytes for a Whisper model before it is loaded (0 if unknown)"""
+    return WHISPER_PARAM_COUNTS.get(model_size, 0) * bytes_per_param
+
+
+def total_system_memory():
+    """Physical RAM in bytes"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def available_memory(device):
+    """Bytes currently free on the CUDA device, or available system RAM (0 if unknown)"""
+    if device == "cuda":
+        import torch
+        return torch.cuda.mem_get_info()[0]
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def default_budget(device, fraction):
+    """Default pool budget: a fraction of VRAM on CUDA, or of system RAM otherwise"""
+    if device == "cuda":
+        import torch
+        return int(torch.cuda.get_device_properties(0).total_memory * fraction)
+    return int(total_system_memory() * fraction)
+
+
+def process_memory():
+    """Current RSS (plus PSS and shared bytes on Linux) of this process and CUDA allocator usage, in bytes"""
+    rss = 0
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Not Linux: fall back to the peak RSS (kilobytes on Linux/BSD, bytes on macOS)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    info = {"rss_bytes": rss, "pid": os.getpid()}
+    # Proportional and shared set sizes show how much of the RSS is copy-on-write weights shared with other workers
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line and not line.startswith(" "))
+        kb = lambda name: int(fields[name].split()[0]) * 1024
+        info["pss_bytes"] = kb("Pss")
+        info["shared_bytes"] = kb("Shared_Clean") + kb("Shared_Dirty")
+    except (OSError, ValueError, KeyError):
+        pass
+    # Only report CUDA usage once torch is loaded; never import it just for stats
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        info["cuda_allocated_bytes"] = torch.cuda.memory_allocated()
+        info["cuda_reserved_bytes"] = torch.cuda.memory_reserved()
+    return info
+
+
+def release_memory():
+    """Collect dropped models and hand cached CUDA blocks back to the driver"""
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
@@ -0,0 +1,171 @@
+import time
+import logging
+from threading import Lock
+from contextlib import contextmanager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from cache hits up to long-recording transcriptions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# All metrics, in registration order, for rendering
+REGISTRY = []
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time"""
+
+    def __init__(self, name, documentation, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        REGISTRY.append(self)
+
+    def render(self):
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.error(f"Error reading gauge {self.name}: {str(e)}")
+            return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with optional labels"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+        self.lock = Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', bound))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Hot-path metrics shared by the API, the job queue and both model pools.
+# Metrics live in the process that records them: with TRANSCRIBE_EXECUTOR=process the
+# stage, pool and model-load metrics recorded inside jobs stay in the worker processes
+# and are missing from /api/metrics; queue wait and upload stages are always recorded here
+TRANSCRIPTION_STAGE_SECONDS = Histogram(
+    "transcription_stage_seconds",
+    "Time spent in each transcription stage",
+    ["stage", "backend", "model", "language"],
+)
+UPLOAD_STAGE_SECONDS = Histogram(
+    "upload_stage_seconds",
+    "Time spent in each upload stage",
+    ["stage"],
+)
+JOB_QUEUE_WAIT_SECONDS = Histogram(
+    "job_queue_wait_seconds",
+    "Time a transcription job waited for a worker",
+)
+POOL_LOCK_WAIT_SECONDS = Histogram(
+    "model_pool_lock_wait_seconds",
+    "Time spent waiting to acquire a model pool lock",
+    ["pool"],
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "model_load_seconds",
+    "Time spent loading a model into a pool",
+    ["pool", "model"],
+)
+POOL_REQUESTS_TOTAL = Counter(
+    "model_pool_requests_total",
+    "Model pool lookups by result (hit, miss or wait for an in-flight load)",
+    ["pool", "result"],
+)
+POOL_EVICTIONS_TOTAL = Counter(
+    "model_pool_evictions_total",
+    "Models evicted from a pool to stay within its memory budget",
+    ["pool"],
+)
+
+
+@contextmanager
+def timed_lock(lock, pool):
+    """Acquire a pool lock, recording how long the acquire blocked"""
+    start = time.perf_counter()
+    lock.acquire()
+    POOL_LOCK_WAIT_SECONDS.observe(time.perf_counter() - start, pool=pool)
+    try:
+        yield
+    finally:
+        lock.release()
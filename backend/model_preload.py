@@ -1,13 +1,24 @@
-import torch
 import os
+import time
 import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from transcription import model_pool, get_device
 from hf_transcription import preload_hf_model, DEFAULT_MODEL_ID
+from memory_utils import estimate_whisper_footprint, default_budget, release_memory, WHISPER_POOL_FRACTION
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Startup warm-up settings, overridable from the environment
+WARMUP_MODELS = [m.strip() for m in os.environ.get("WARMUP_MODELS", "turbo").split(",") if m.strip()]
+WARMUP_HF = os.environ.get("WARMUP_HF", "0") == "1"
+WARMUP_INFERENCE = os.environ.get("WARMUP_INFERENCE", "1") == "1"
+
+# Readiness state reported by /api/ready (ready only once warm-up finished without error)
+warmup_state = {"ready": False, "finished": False, "loaded": [], "error": None, "duration": None}
+
 def preload_model(model_size="large-v3", use_hf=False):
     """
     Preload model into memory to avoid cold start delays
@@ -17,8 +28,7 @@ def preload_model(model_size="large-v3", use_hf=False):
         use_hf: Whether to use the HuggingFace model instead of the original Whisper model
     """
     # Force garbage collection to free up memory
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
+    release_memory()
     
     if use_hf:
         logger.info(f"Preloading HuggingFace Whisper model...")
@@ -44,6 +54,67 @@ def preload_all_models():
     
     return {"message": "All models preloaded successfully"}
 
+def warm_up_model(model_size):
+    """Load a Whisper model and run one short decode to prime kernels and allocators"""
+    import whisper
+
+    model = model_pool.get_model(model_size)
+    if WARMUP_INFERENCE:
+        mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(np.zeros(whisper.audio.SAMPLE_RATE, dtype=np.float32)), n_mels=model.dims.n_mels)
+        options = whisper.DecodingOptions(language="en", fp16=model.device.type == "cuda", without_timestamps=True, sample_len=8)
+        with model_pool.inference_lock(model_size):
+            whisper.decode(model, mel.to(model.device), options)
+    logger.info(f"Warmed up {model_size} model")
+    return model_size
+
+def plan_waves(model_sizes, budget):
+    """Group models into waves whose estimated footprints fit in the pool budget together"""
+    waves = []
+    current, current_bytes = [], 0
+    for model_size in model_sizes:
+        name = "large-v3-turbo" if model_size.lower() == "turbo" else model_size
+        estimate = estimate_whisper_footprint(name)
+        if current and current_bytes + estimate > budget:
+            waves.append(current)
+            current, current_bytes = [], 0
+        current.append(model_size)
+        current_bytes += estimate
+    if current:
+        waves.append(current)
+    return waves
+
+def warm_up_models(model_sizes=None, use_hf=None):
+    """
+    Load and warm up the configured models at startup, in parallel where the memory budget allows.
+    Marks the worker ready once every model is warm; a failure is recorded in warmup_state["error"]
+    and keeps the worker unready, so it is not sent traffic it cannot serve.
+    
+    Args:
+        model_sizes: Whisper model sizes to load (defaults to WARMUP_MODELS)
+        use_hf: Whether to also load the HuggingFace pipeline (defaults to WARMUP_HF)
+    """
+    model_sizes = WARMUP_MODELS if model_sizes is None else model_sizes
+    use_hf = WARMUP_HF if use_hf is None else use_hf
+    start_time = time.time()
+    try:
+        budget = model_pool.max_bytes or default_budget(get_device(), WHISPER_POOL_FRACTION)
+        for wave in plan_waves(model_sizes, budget):
+            logger.info(f"Warming up models in parallel: {', '.join(wave)}")
+            with ThreadPoolExecutor(max_workers=len(wave)) as executor:
+                for model_size in executor.map(warm_up_model, wave):
+                    warmup_state["loaded"].append(model_size)
+        if use_hf:
+            preload_model(use_hf=True)
+            warmup_state["loaded"].append(DEFAULT_MODEL_ID)
+    except Exception as e:
+        logger.error(f"Error during model warm-up: {str(e)}")
+        warmup_state["error"] = str(e)
+    finally:
+        warmup_state["duration"] = time.time() - start_time
+        warmup_state["finished"] = True
+        warmup_state["ready"] = warmup_state["error"] is None
+        logger.info(f"Warm-up finished in {warmup_state['duration']:.1f} seconds")
+
 if __name__ == "__main__":
     # Preload model when script is run directly
     preload_all_models()
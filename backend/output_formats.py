@@ -0,0 +1,89 @@
+import os
+import json
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Output formats served from one stored set of segments
+OUTPUT_FORMATS = {
+    "text": "text/plain; charset=utf-8",
+    "json": "application/json",
+    "srt": "application/x-subrip",
+    "vtt": "text/vtt; charset=utf-8",
+}
+
+SEGMENTS_FILENAME = "segments.json"
+
+
+def segments_path(transcription_path):
+    """Path of the segments stored next to a transcription.txt"""
+    return os.path.join(os.path.dirname(transcription_path), SEGMENTS_FILENAME)
+
+
+def save_segments(transcription_path, transcription, segments):
+    """Persist the text and timed segments of a transcription so every format can be rendered later"""
+    path = segments_path(transcription_path)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"text": transcription, "segments": segments}, f, ensure_ascii=False)
+    logger.info(f"Segments saved to {path}")
+    return path
+
+
+def load_segments(transcription_path):
+    """Return the stored {"text", "segments"} of a transcription, or None if it has none"""
+    path = segments_path(transcription_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def format_timestamp(seconds, separator):
+    """HH:MM:SS<sep>mmm, with "," for SRT and "." for VTT"""
+    milliseconds = int(round(max(seconds, 0.0) * 1000))
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def to_srt(segments):
+    blocks = []
+    for index, seg in enumerate((s for s in segments if s["text"]), start=1):
+        blocks.append(
+            f"{index}\n{format_timestamp(seg['start'], ',')} --> {format_timestamp(seg['end'], ',')}\n{seg['text'].strip()}\n"
+        )
+    return "\n".join(blocks)
+
+
+def to_vtt(segments):
+    blocks = ["WEBVTT\n"]
+    for seg in segments:
+        if seg["text"]:
+            blocks.append(f"{format_timestamp(seg['start'], '.')} --> {format_timestamp(seg['end'], '.')}\n{seg['text'].strip()}\n")
+    return "\n".join(blocks)
+
+
+def render(transcription, segments, output_format="text"):
+    """
+    Render a transcription in one of OUTPUT_FORMATS.
+
+    Args:
+        transcription: The full text
+        segments: List of {"start", "end", "text"} dicts (seconds on the recording's timeline)
+        output_format: "text", "json", "srt" or "vtt"
+
+    Returns:
+        The rendered document as a string
+    """
+    if output_format == "text":
+        return transcription
+    if output_format == "json":
+        return json.dumps({"text": transcription, "segments": segments}, ensure_ascii=False)
+    if output_format == "srt":
+        return to_srt(segments)
+    if output_format == "vtt":
+        return to_vtt(segments)
+    raise ValueError(f"Unsupported output format '{output_format}'. Choose from: {', '.join(OUTPUT_FORMATS)}")
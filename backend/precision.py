@@ -0,0 +1,47 @@
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# "auto" keeps the original behaviour: fp16 on CUDA, fp32 on CPU
+PRECISIONS = ["auto", "fp32", "bf16", "int8"]
+# openai-whisper casts weights to the fp32 activations on every call, so bf16 would only
+# add conversions there; it is offered on the HF pipeline, which runs bf16 end to end
+WHISPER_PRECISIONS = ["auto", "fp32", "int8"]
+
+
+def check_precision(precision, device, precisions=PRECISIONS):
+    """Validate a precision for the device and backend, raising ValueError if unsupported"""
+    if precision not in precisions:
+        raise ValueError(f"Invalid precision '{precision}'. Choose from: {', '.join(precisions)}")
+    if precision == "int8" and device != "cpu":
+        raise ValueError("int8 dynamic quantization is only supported on CPU")
+
+
+def quantize_int8(model):
+    """Replace every nn.Linear with a dynamically quantized int8 Linear (CPU only)"""
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def apply_whisper_precision(model, precision):
+    """
+    Convert an openai-whisper model to the requested precision in place.
+
+    int8 swaps whisper's Linear subclass for nn.Linear (identical on fp32 input) so
+    torch's dynamic quantization picks the layers up.
+    """
+    import torch
+    import whisper.model as whisper_model
+
+    if precision in ("auto", "fp32"):
+        return model
+
+    for module in model.modules():
+        if type(module) is whisper_model.Linear:
+            module.__class__ = torch.nn.Linear
+    quantized = quantize_int8(model)
+    logger.info("Applied int8 dynamic quantization to Whisper Linear layers")
+    return quantized
@@ -0,0 +1,134 @@
+"""
+Multi-worker server whose model weights are loaded once and shared copy-on-write.
+
+The parent process loads the warm-up models, freezes the garbage collector so
+object headers are not rewritten, binds the socket and then forks the workers.
+Weight tensors are never written after loading, so their pages stay shared and
+RSS does not grow with the worker count.
+
+Usage (from the repository root, like the app itself):
+    python backend/serve.py --workers 4
+"""
+import os
+import gc
+import sys
+import time
+import socket
+import signal
+import logging
+import argparse
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SERVE_WORKERS = int(os.environ.get("SERVE_WORKERS", "2"))
+# Torch intra-op threads per worker (default: split the cores between workers)
+SERVE_THREADS_PER_WORKER = int(os.environ.get("SERVE_THREADS_PER_WORKER", "0"))
+
+
+def preload_shared_models(model_sizes, use_hf):
+    """Load models in the parent so every forked worker maps the same weight pages"""
+    from transcription import model_pool
+    from hf_transcription import hf_model_pool, DEFAULT_MODEL_ID
+
+    for model_size in model_sizes:
+        model_pool.get_model(model_size)
+        logger.info(f"Loaded {model_size} before forking")
+    if use_hf:
+        hf_model_pool.get_pipeline(DEFAULT_MODEL_ID)
+        logger.info(f"Loaded {DEFAULT_MODEL_ID} before forking")
+
+
+def run_worker(app, sock, threads, timeout_keep_alive):
+    import torch
+    import uvicorn
+
+    torch.set_num_threads(threads)
+    config = uvicorn.Config(app, timeout_keep_alive=timeout_keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(host="0.0.0.0", port=8000, workers=SERVE_WORKERS, threads=SERVE_THREADS_PER_WORKER, timeout_keep_alive=120):
+    import main
+    from transcription import get_device
+    from model_preload import WARMUP_MODELS, WARMUP_HF
+
+    if get_device() == "cuda" or not hasattr(os, "fork"):
+        # A CUDA context cannot cross fork(); keep one process that owns the GPU
+        logger.warning("Copy-on-write workers need fork() and CPU inference, serving with a single worker")
+        import uvicorn
+        uvicorn.run(main.app, host=host, port=port, workers=1, timeout_keep_alive=timeout_keep_alive)
+        return
+
+    threads = threads or max(1, (os.cpu_count() or workers) // workers)
+    # Load single-threaded so no OpenMP thread pool exists at fork time
+    import torch
+    torch.set_num_threads(1)
+    preload_shared_models(WARMUP_MODELS, WARMUP_HF)
+    # Move everything allocated so far out of the GC's reach so collections in the
+    # workers do not touch (and copy) the pages holding the parent's objects
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                run_worker(main.app, sock, threads, timeout_keep_alive)
+            finally:
+                os._exit(0)
+        children.add(pid)
+        logger.info(f"Started worker {pid} ({threads} threads)")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workers):
+        spawn()
+
+    # Replace workers that die unexpectedly; the parent still holds the shared weights
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited with status {status}, restarting")
+            time.sleep(1)
+            spawn()
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the API from several workers sharing one copy of the models")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--threads", type=int, default=SERVE_THREADS_PER_WORKER, help="Torch threads per worker (0 = cores / workers)")
+    args = parser.parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    serve(args.host, args.port, args.workers, args.threads)
@@ -0,0 +1,178 @@
+import os
+import time
+import uuid
+import sqlite3
+import logging
+from threading import Lock
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Sessions older than this many days are removed by retention sweeps (0 keeps everything)
+SESSION_RETENTION_DAYS = float(os.environ.get("SESSION_RETENTION_DAYS", "0"))
+# Hours between retention sweeps while the server runs (the first one runs at startup)
+SESSION_SWEEP_INTERVAL_HOURS = float(os.environ.get("SESSION_SWEEP_INTERVAL_HOURS", "24"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    date_folder TEXT NOT NULL,
+    session_folder TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    language TEXT,
+    duration REAL,
+    audio_sha256 TEXT,
+    upload_seconds REAL,
+    backend TEXT,
+    model TEXT,
+    transcription_seconds REAL,
+    transcribed_at REAL,
+    UNIQUE (date_folder, session_folder)
+);
+CREATE INDEX IF NOT EXISTS sessions_created_at ON sessions (created_at);
+CREATE INDEX IF NOT EXISTS sessions_date ON sessions (date_folder, created_at);
+CREATE INDEX IF NOT EXISTS sessions_audio_sha256 ON sessions (audio_sha256);
+"""
+
+# Columns callers may set through update()
+FIELDS = ("language", "duration", "audio_sha256", "upload_seconds", "backend", "model", "transcription_seconds", "transcribed_at")
+
+
+class SessionIndex:
+    """
+    SQLite index of recording sessions, so lookups, listings and retention sweeps
+    are indexed queries rather than walks over STORAGE_DIR.
+    """
+
+    def __init__(self, storage_dir, db_path=None):
+        self.storage_dir = storage_dir
+        self.db_path = db_path or os.path.join(storage_dir, "sessions.db")
+        self.lock = Lock()
+        self._conn = None
+        self._pid = None
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    @property
+    def conn(self):
+        # A connection must not cross a fork, so process-pool workers open their own
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._conn.row_factory = sqlite3.Row
+            # WAL lets worker processes write while the API reads
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    def create(self, date_folder, session_folder, language=None, created_at=None):
+        """Register a new session and return its unique ID"""
+        session_id = uuid.uuid4().hex
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO sessions (session_id, date_folder, session_folder, created_at, language) VALUES (?, ?, ?, ?, ?)",
+                (session_id, date_folder, session_folder, created_at or time.time(), language),
+            )
+        return session_id
+
+    def update(self, session_id, **fields):
+        """Set metadata columns on a session"""
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown session fields: {', '.join(sorted(unknown))}")
+        if not fields:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock, self.conn:
+            self.conn.execute(f"UPDATE sessions SET {assignments} WHERE session_id = ?", (*fields.values(), session_id))
+
+    def get(self, session_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find(self, date_folder, session_folder):
+        """Look up a session by its storage folders"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM sessions WHERE date_folder = ? AND session_folder = ?", (date_folder, session_folder)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def find_by_dir(self, session_dir):
+        """Look up a session by its directory under storage_dir"""
+        relative = os.path.relpath(os.path.abspath(session_dir), self.storage_dir)
+        date_folder, _, session_folder = relative.replace(os.sep, "/").partition("/")
+        return self.find(date_folder, session_folder)
+
+    def list(self, date_folder=None, language=None, before=None, limit=50):
+        """
+        List sessions newest first.
+
+        Args:
+            date_folder: Only sessions of this YYYY-MM-DD folder
+            language: Only sessions in this language
+            before: Only sessions created before this timestamp (for paging)
+            limit: Maximum number of sessions returned
+        """
+        clauses, params = [], []
+        if date_folder:
+            clauses.append("date_folder = ?")
+            params.append(date_folder)
+        if language:
+            clauses.append("language = ?")
+            params.append(language.lower())
+        if before is not None:
+            clauses.append("created_at < ?")
+            params.append(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT * FROM sessions {where} ORDER BY created_at DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def date_sessions(self, date_folder):
+        """(date_folder, session_folder) pairs of a day, oldest first"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT session_folder FROM sessions WHERE date_folder = ? ORDER BY created_at", (date_folder,)
+            ).fetchall()
+        return [(date_folder, row["session_folder"]) for row in rows]
+
+    def expired(self, max_age_seconds, now=None):
+        """Sessions created more than max_age_seconds ago"""
+        cutoff = (now or time.time()) - max_age_seconds
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM sessions WHERE created_at < ? ORDER BY created_at", (cutoff,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete(self, session_id):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def backfill(self):
+        """Register session folders that predate the index (one directory walk, at startup)"""
+        added = 0
+        for date_folder in sorted(os.listdir(self.storage_dir)):
+            date_dir = os.path.join(self.storage_dir, date_folder)
+            if not os.path.isdir(date_dir) or date_folder.startswith("_"):
+                continue
+            for session_folder in sorted(os.listdir(date_dir)):
+                session_dir = os.path.join(date_dir, session_folder)
+                if not os.path.exists(os.path.join(session_dir, "audio.webm")):
+                    continue
+                with self.lock, self.conn:
+                    cursor = self.conn.execute(
+                        "INSERT OR IGNORE INTO sessions (session_id, date_folder, session_folder, created_at) VALUES (?, ?, ?, ?)",
+                        (uuid.uuid4().hex, date_folder, session_folder, os.path.getmtime(session_dir)),
+                    )
+                added += cursor.rowcount
+        if added:
+            logger.info(f"Indexed {added} existing sessions")
+        return added
+
+    def stats(self):
+        with self.lock:
+            row = self.conn.execute("SELECT COUNT(*) AS sessions, SUM(duration) AS duration FROM sessions").fetchone()
+        return {"total_sessions": row["sessions"], "total_duration": row["duration"] or 0.0}
@@ -0,0 +1,236 @@
+import os
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Assisted decoding settings, overridable from the environment
+WHISPER_DRAFT_MODEL = os.environ.get("WHISPER_DRAFT_MODEL", "")  # empty = WHISPER_DRAFT_MODELS
+# The draft must share the tokenizer and mel input of the model it assists and decode much
+# faster: large-v3 (128 mel bins, 32 decoder layers) is drafted by turbo (4 layers), the
+# 80-mel models by base or tiny. turbo has no cheaper drafter with its input.
+WHISPER_DRAFT_MODELS = {
+    "base": "tiny",
+    "small": "base",
+    "medium": "base",
+    "large-v1": "base",
+    "large-v2": "base",
+    "large-v3": "turbo",
+}
+# distil-large-v3 is loaded decoder-only and reuses the main model's encoder output, so it
+# can only assist models whose encoder it was distilled with (large-v3, not turbo)
+HF_DRAFT_MODEL_ID = os.environ.get("HF_DRAFT_MODEL_ID", "distil-whisper/distil-large-v3")
+HF_DRAFT_TARGETS = [m.strip() for m in os.environ.get("HF_DRAFT_TARGETS", "openai/whisper-large-v3").split(",") if m.strip()]
+DRAFT_TOKENS = int(os.environ.get("SPECULATIVE_DRAFT_TOKENS", "4"))
+
+# (mel bins, vocabulary size) of the openai-whisper checkpoints, so a draft can be
+# ruled out before either model is loaded
+WHISPER_INPUT_DIMS = {
+    "tiny": (80, 51865),
+    "base": (80, 51865),
+    "small": (80, 51865),
+    "medium": (80, 51865),
+    "tiny.en": (80, 51864),
+    "base.en": (80, 51864),
+    "small.en": (80, 51864),
+    "medium.en": (80, 51864),
+    "large-v1": (80, 51865),
+    "large-v2": (80, 51865),
+    "large-v3": (128, 51866),
+    "large-v3-turbo": (128, 51866),
+    "turbo": (128, 51866),
+}
+
+
+def can_draft(model, draft):
+    """Whether draft can propose tokens for model (same vocabulary and mel input)"""
+    return model.dims.n_vocab == draft.dims.n_vocab and model.dims.n_mels == draft.dims.n_mels
+
+
+def whisper_draft_model(model_size):
+    """Draft model for model_size: WHISPER_DRAFT_MODEL if set, else its WHISPER_DRAFT_MODELS pairing (None if none)"""
+    return WHISPER_DRAFT_MODEL or WHISPER_DRAFT_MODELS.get(model_size.lower())
+
+
+def draft_compatible(model_size, draft_size=None):
+    """
+    Whether draft_size (default: whisper_draft_model(model_size)) can assist model_size, from their known dimensions.
+
+    Returns False when there is no draft for model_size, and None when either model is
+    unknown; can_draft() then decides once both are loaded.
+    """
+    draft_size = draft_size or whisper_draft_model(model_size)
+    if draft_size is None:
+        return False
+    model_dims = WHISPER_INPUT_DIMS.get(model_size.lower())
+    draft_dims = WHISPER_INPUT_DIMS.get(draft_size.lower())
+    if model_dims is None or draft_dims is None:
+        return None
+    return model_dims == draft_dims
+
+
+def hf_draft_compatible(model_id):
+    """Whether HF_DRAFT_MODEL_ID can assist model_id by sharing its encoder output"""
+    return model_id in HF_DRAFT_TARGETS
+
+
+def _suppress_ids(tokenizer):
+    # Same tokens whisper.decode suppresses by default (suppress_tokens="-1")
+    return sorted(set(tokenizer.non_speech_tokens) | {
+        tokenizer.transcribe, tokenizer.translate, tokenizer.sot, tokenizer.sot_prev, tokenizer.sot_lm, tokenizer.no_timestamps,
+    })
+
+
+class _DecoderCache:
+    """
+    Self-attention keys/values of the tokens fed so far, and the cross-attention ones of the audio.
+
+    whisper's own kv-cache hooks cannot verify several tokens on top of a cache: its causal
+    mask is aligned to the first key, so the cached positions would be masked wrongly.
+    """
+
+    def __init__(self, decoder, audio):
+        self.keys = [None] * len(decoder.blocks)
+        self.values = [None] * len(decoder.blocks)
+        self.cross = [(block.cross_attn.key(audio), block.cross_attn.value(audio)) for block in decoder.blocks]
+        self.length = 0
+
+    def truncate(self, length):
+        # Forget positions past length (rejected draft tokens)
+        self.length = min(self.length, length)
+        self.keys = [k[:, :self.length] if k is not None else None for k in self.keys]
+        self.values = [v[:, :self.length] if v is not None else None for v in self.values]
+
+
+def _attention(q, k, v, n_head, mask=None):
+    # Same computation as whisper's MultiHeadAttention.qkv_attention, with an explicit mask
+    import torch
+
+    n_state = q.shape[-1]
+    scale = (n_state // n_head) ** -0.25
+    q = q.view(*q.shape[:2], n_head, -1).permute(0, 2, 1, 3)
+    k = k.view(*k.shape[:2], n_head, -1).permute(0, 2, 3, 1)
+    v = v.view(*v.shape[:2], n_head, -1).permute(0, 2, 1, 3)
+    qk = (q * scale) @ (k * scale)
+    if mask is not None:
+        qk = qk + mask
+    w = torch.softmax(qk.float(), dim=-1).to(q.dtype)
+    return (w @ v).permute(0, 2, 1, 3).flatten(start_dim=2)
+
+
+def _decoder_logits(decoder, tokens, cache):
+    """
+    Logits of whisper's TextDecoder for tokens fed after the cache.length cached ones.
+
+    Query i attends to every cached position and to the new tokens up to itself.
+    """
+    import torch
+
+    offset = cache.length
+    n_ctx = tokens.shape[-1]
+    x = decoder.token_embedding(tokens) + decoder.positional_embedding[offset:offset + n_ctx]
+    x = x.to(cache.cross[0][0].dtype)
+    mask = torch.full((n_ctx, offset + n_ctx), -float("inf"), device=x.device).triu_(offset + 1)
+
+    for i, block in enumerate(decoder.blocks):
+        attn = block.attn
+        h = block.attn_ln(x)
+        k, v = attn.key(h), attn.value(h)
+        if cache.keys[i] is not None:
+            k = torch.cat([cache.keys[i], k], dim=1)
+            v = torch.cat([cache.values[i], v], dim=1)
+        cache.keys[i], cache.values[i] = k, v
+        x = x + attn.out(_attention(attn.query(h), k, v, attn.n_head, mask))
+
+        cross_k, cross_v = cache.cross[i]
+        x = x + block.cross_attn.out(_attention(block.cross_attn.query(block.cross_attn_ln(x)), cross_k, cross_v, block.cross_attn.n_head))
+        x = x + block.mlp(block.mlp_ln(x))
+    cache.length = offset + n_ctx
+
+    x = decoder.ln(x)
+    return (x @ torch.transpose(decoder.token_embedding.weight.to(x.dtype), 0, 1)).float()
+
+
+def speculative_decode(model, draft, mel, language_code, draft_tokens=DRAFT_TOKENS):
+    """
+    Greedy draft-and-verify decoding of one 30-second window.
+
+    The draft model proposes draft_tokens tokens at a time and the main model checks
+    them in a single forward pass; the longest agreeing prefix is kept plus the main
+    model's own next token. Output matches greedy decoding with the main model alone:
+    there is no temperature fallback or no-speech filtering, and the caller gets a
+    single segment spanning the clip rather than timestamped segments.
+
+    Callers hold the inference locks of both models (see ModelPool.inference_lock).
+
+    Args:
+        model: The Whisper model whose output is returned
+        draft: A smaller Whisper model with the same tokenizer and mel input (see can_draft)
+        mel: (n_mels, 3000) log-mel window
+        language_code: Whisper language code
+        draft_tokens: Tokens proposed per verification step
+
+    Returns:
+        The decoded text
+    """
+    import torch
+    from whisper.tokenizer import get_tokenizer
+
+    tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages, language=language_code, task="transcribe")
+    suppress = _suppress_ids(tokenizer)
+    max_length = model.dims.n_text_ctx // 2
+
+    def next_logits(logits, first):
+        logits = logits.float()
+        logits[..., suppress] = -float("inf")
+        logits[..., tokenizer.timestamp_begin:] = -float("inf")
+        if first:
+            # SuppressBlank: no empty transcription at the first position
+            logits[..., tokenizer.encode(" ") + [tokenizer.eot]] = -float("inf")
+        return logits
+
+    with torch.no_grad():
+        dtype = next(model.parameters()).dtype
+        cache = _DecoderCache(model.decoder, model.embed_audio(mel[None].to(model.device, dtype)))
+        draft_cache = _DecoderCache(draft.decoder, draft.embed_audio(mel[None].to(draft.device, next(draft.parameters()).dtype)))
+
+        prompt = list(tokenizer.sot_sequence_including_notimestamps)
+        tokens = list(prompt)
+        proposed_total, accepted_total = 0, 0
+
+        while len(tokens) - len(prompt) < max_length and tokens[-1] != tokenizer.eot:
+            # Draft: extend greedily from the accepted tokens
+            proposal = []
+            feed = tokens[draft_cache.length:]
+            for _ in range(draft_tokens):
+                logits = _decoder_logits(draft.decoder, torch.tensor([feed], device=draft.device), draft_cache)[:, -1]
+                token = int(next_logits(logits, len(tokens) + len(proposal) == len(prompt)).argmax(-1))
+                proposal.append(token)
+                if token == tokenizer.eot:
+                    break
+                feed = [token]
+
+            # Verify: one main-model pass scores every proposed position
+            feed = tokens[cache.length:] + proposal
+            logits = _decoder_logits(model.decoder, torch.tensor([feed], device=model.device), cache)[0]
+            base = len(feed) - len(proposal) - 1
+            accepted = []
+            for i in range(len(proposal) + 1):
+                token = int(next_logits(logits[base + i], len(tokens) + i == len(prompt)).argmax(-1))
+                accepted.append(token)
+                if i == len(proposal) or token != proposal[i] or token == tokenizer.eot:
+                    break
+            proposed_total += len(proposal)
+            accepted_total += len(accepted) - 1
+
+            # Stop at the same length as greedy decoding would
+            tokens.extend(accepted[:max_length - (len(tokens) - len(prompt))])
+            # Both caches keep only positions whose tokens were accepted
+            cache.truncate(len(tokens) - 1)
+            draft_cache.truncate(len(tokens) - 1)
+
+    if proposed_total:
+        logger.info(f"Speculative decode accepted {accepted_total}/{proposed_total} draft tokens")
+    text_tokens = [t for t in tokens[len(prompt):] if t < tokenizer.eot]
+    return tokenizer.decode(text_tokens).strip()
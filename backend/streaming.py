@@ -0,0 +1,210 @@
+import os
+import logging
+import subprocess
+from threading import Lock, Thread
+import numpy as np
+from transcription import model_pool
+from audio_features import SAMPLE_RATE, CHUNK_LENGTH
+from language_id import to_language_code
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_WINDOW_SECONDS = CHUNK_LENGTH
+
+# Streaming policy, overridable from the environment
+STREAM_STEP_SECONDS = float(os.environ.get("STREAM_STEP_SECONDS", "1.0"))
+STREAM_WINDOW_SECONDS = float(os.environ.get("STREAM_WINDOW_SECONDS", "15"))
+# Concurrent streaming sessions; each decodes on its own thread outside the job scheduler
+STREAM_MAX_SESSIONS = int(os.environ.get("STREAM_MAX_SESSIONS", "4"))
+
+
+class WebmStreamDecoder:
+    """
+    Decodes MediaRecorder webm chunks with one long-lived ffmpeg process and returns
+    the PCM samples that appeared since the last call.
+
+    Chunks are written to ffmpeg's stdin as they arrive (and kept in a file for the
+    session), and a reader thread collects the 16 kHz PCM ffmpeg produces, so each
+    chunk costs only its own decode regardless of how long the recording already is.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.process = subprocess.Popen(
+            [
+                "ffmpeg", "-nostdin", "-threads", "0", "-i", "pipe:0",
+                "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+                "-loglevel", "error", "pipe:1",
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self.pcm = bytearray()
+        self.lock = Lock()
+        self.failed = False
+        # Drain stdout continuously so ffmpeg never blocks on a full pipe
+        self.reader = Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        while True:
+            data = self.process.stdout.read1(65536)
+            if not data:
+                return
+            with self.lock:
+                self.pcm.extend(data)
+
+    def append(self, data):
+        self.file.write(data)
+        if self.failed:
+            return
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            logger.warning("ffmpeg stopped accepting the stream; no more audio will be decoded")
+            self.failed = True
+
+    def decode_new(self):
+        """Samples decoded since the last call (whole 16-bit samples only)"""
+        with self.lock:
+            usable = len(self.pcm) - len(self.pcm) % 2
+            raw = bytes(self.pcm[:usable])
+            del self.pcm[:usable]
+        return np.frombuffer(raw, np.int16).astype(np.float32) / 32768.0
+
+    def finish(self):
+        """Close the input, let ffmpeg flush the last frames and return the remaining samples"""
+        self.file.close()
+        if not self.failed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        self.process.wait()
+        self.reader.join()
+        return self.decode_new()
+
+    def abort(self):
+        """Stop ffmpeg if the stream ends without finish()"""
+        if not self.file.closed:
+            self.file.close()
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+class StreamingTranscriber:
+    """
+    Incremental transcription over a sliding window of audio.
+
+    Audio is decoded in windows of at most MAX_WINDOW_SECONDS. Once the window grows
+    past window_seconds, every segment but the last is finalized and the window is
+    trimmed to start where the last segment begins, so the cost of each decode is
+    bounded by the window size rather than the length of the recording.
+    """
+
+    def __init__(self, model, language_code, step_seconds=1.0, window_seconds=15, lock=None):
+        self.model = model
+        # Held around each decode: the pooled model is shared with other streams and jobs
+        self.lock = lock or Lock()
+        self.language_code = language_code
+        self.step_samples = int(step_seconds * SAMPLE_RATE)
+        self.window_samples = int(min(window_seconds, MAX_WINDOW_SECONDS) * SAMPLE_RATE)
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_offset = 0.0  # seconds of audio before the start of buffer
+        self.pending_samples = 0
+        self.finalized = []
+
+    def insert_audio(self, samples):
+        """Append 16 kHz float32 samples to the window"""
+        if len(samples) == 0:
+            return
+        self.buffer = np.concatenate([self.buffer, samples.astype(np.float32, copy=False)])
+        self.pending_samples += len(samples)
+
+    def ready(self):
+        """Whether enough new audio arrived to be worth another decode"""
+        return self.pending_samples >= self.step_samples
+
+    def process(self, final=False):
+        """
+        Decode the current window.
+
+        Args:
+            final: Finalize everything left in the window (end of stream)
+
+        Returns:
+            Tuple of (newly finalized segments, partial text of the unfinalized tail)
+        """
+        self.pending_samples = 0
+        if len(self.buffer) == 0:
+            return [], ""
+
+        with self.lock:
+            result = self.model.transcribe(
+                self.buffer,
+                language=self.language_code,
+                task="transcribe",
+                condition_on_previous_text=False,
+                initial_prompt=self._prompt(),
+                fp16=self.model.device.type == "cuda",
+            )
+        segments = [
+            {
+                "start": round(seg["start"] + self.buffer_offset, 2),
+                "end": round(seg["end"] + self.buffer_offset, 2),
+                "text": seg["text"].strip(),
+            }
+            for seg in result["segments"]
+            if seg["text"].strip()
+        ]
+
+        if final or len(self.buffer) >= MAX_WINDOW_SECONDS * SAMPLE_RATE:
+            # End of stream, or no segment boundary inside a full window: commit everything
+            committed, tail = segments, []
+            self.buffer_offset += len(self.buffer) / SAMPLE_RATE
+            self.buffer = np.zeros(0, dtype=np.float32)
+        elif len(self.buffer) >= self.window_samples and len(segments) > 1:
+            committed, tail = segments[:-1], segments[-1:]
+            cut = tail[0]["start"] - self.buffer_offset
+            self.buffer = self.buffer[int(cut * SAMPLE_RATE):]
+            self.buffer_offset += cut
+        else:
+            committed, tail = [], segments
+
+        self.finalized.extend(committed)
+        return committed, " ".join(seg["text"] for seg in tail)
+
+    def text(self):
+        """Full text of all finalized segments"""
+        return " ".join(seg["text"] for seg in self.finalized)
+
+    def duration(self):
+        """Seconds of audio received so far"""
+        return self.buffer_offset + len(self.buffer) / SAMPLE_RATE
+
+    def _prompt(self):
+        # Condition the next window on the tail of what was already finalized
+        return self.text()[-200:] or None
+
+
+def create_stream(language="tiếng việt", model_size="turbo"):
+    """
+    Create a StreamingTranscriber backed by a model from the pool.
+
+    Args:
+        language: Language of the audio (english or vietnamese)
+        model_size: Size of the Whisper model to use
+
+    Returns:
+        A ready StreamingTranscriber
+    """
+    # Map UI language choices to Whisper language codes (detected codes pass through)
+    language_code = to_language_code(language)
+    model = model_pool.get_model(model_size)
+    return StreamingTranscriber(model, language_code, STREAM_STEP_SECONDS, STREAM_WINDOW_SECONDS, lock=model_pool.inference_lock(model_size))
@@ -0,0 +1,14 @@
+from speculative import WHISPER_DRAFT_MODELS, WHISPER_INPUT_DIMS, draft_compatible
+
+
+def test_default_pairings_are_compatible_and_smaller():
+    order = ["tiny", "base", "small", "medium", "large-v1", "large-v2", "turbo", "large-v3"]
+    for model_size, draft_size in WHISPER_DRAFT_MODELS.items():
+        assert WHISPER_INPUT_DIMS[model_size] == WHISPER_INPUT_DIMS[draft_size]
+        assert order.index(draft_size) < order.index(model_size)
+
+
+def test_large_v3_has_a_draft_and_turbo_has_none():
+    assert draft_compatible("large-v3") is True
+    assert draft_compatible("turbo") is False
+    assert draft_compatible("large-v3", "base") is False
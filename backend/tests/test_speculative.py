@@ -0,0 +1,71 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+whisper_model = pytest.importorskip("whisper.model")
+
+from whisper.tokenizer import get_tokenizer
+from speculative import speculative_decode, _DecoderCache, _decoder_logits, _suppress_ids
+
+# A small multilingual model: the real tokenizer and mel input, few and narrow layers
+DIMS = whisper_model.ModelDimensions(
+    n_mels=80, n_audio_ctx=1500, n_audio_state=64, n_audio_head=4, n_audio_layer=2,
+    n_vocab=51865, n_text_ctx=448, n_text_state=64, n_text_head=4, n_text_layer=2,
+)
+
+
+def random_model(seed):
+    torch.manual_seed(seed)
+    model = whisper_model.Whisper(DIMS).eval()
+    # Allocated uninitialized (checkpoints fill it in)
+    torch.nn.init.normal_(model.decoder.positional_embedding)
+    return model
+
+
+def random_mel(seed=123):
+    generator = torch.Generator().manual_seed(seed)
+    return torch.randn(DIMS.n_mels, 3000, generator=generator)
+
+
+def greedy_decode(model, mel, language_code):
+    """Reference: greedy decoding with a full decoder pass per token and the same suppression"""
+    tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages, language=language_code, task="transcribe")
+    suppress = _suppress_ids(tokenizer)
+    tokens = list(tokenizer.sot_sequence_including_notimestamps)
+    prompt = len(tokens)
+    with torch.no_grad():
+        audio = model.embed_audio(mel[None])
+        while len(tokens) - prompt < model.dims.n_text_ctx // 2 and tokens[-1] != tokenizer.eot:
+            logits = model.logits(torch.tensor([tokens]), audio)[0, -1].float()
+            logits[suppress] = -float("inf")
+            logits[tokenizer.timestamp_begin:] = -float("inf")
+            if len(tokens) == prompt:
+                logits[tokenizer.encode(" ") + [tokenizer.eot]] = -float("inf")
+            tokens.append(int(logits.argmax()))
+    return tokenizer.decode([t for t in tokens[prompt:] if t < tokenizer.eot]).strip()
+
+
+def test_cached_decoder_matches_full_pass():
+    model = random_model(0)
+    tokens = torch.randint(0, 50000, (1, 12), generator=torch.Generator().manual_seed(7))
+    with torch.no_grad():
+        audio = model.embed_audio(random_mel()[None])
+        full = model.logits(tokens, audio)
+
+        cache = _DecoderCache(model.decoder, audio)
+        # Several tokens on top of a non-empty cache, as in the verify pass
+        first = _decoder_logits(model.decoder, tokens[:, :5], cache)
+        rest = _decoder_logits(model.decoder, tokens[:, 5:], cache)
+        torch.testing.assert_close(torch.cat([first, rest], dim=1), full, atol=1e-4, rtol=1e-4)
+
+        # Rejected positions are dropped and recomputed
+        cache.truncate(8)
+        again = _decoder_logits(model.decoder, tokens[:, 8:], cache)
+        torch.testing.assert_close(again, full[:, 8:], atol=1e-4, rtol=1e-4)
+
+
+@pytest.mark.parametrize("draft_seed", [0, 1], ids=["identical-draft", "different-draft"])
+def test_speculative_decode_matches_greedy(draft_seed):
+    model = random_model(0)
+    draft = random_model(draft_seed)
+    mel = random_mel()
+    assert speculative_decode(model, draft, mel, "en", draft_tokens=4) == greedy_decode(model, mel, "en")
@@ -1,71 +1,158 @@
 import os
 import logging
-import whisper
-import torch
 from threading import Lock
+from concurrent.futures import Future
 import time
+from metrics import timed_lock, TRANSCRIPTION_STAGE_SECONDS, MODEL_LOAD_SECONDS, POOL_REQUESTS_TOTAL, POOL_EVICTIONS_TOTAL
+from precision import check_precision, WHISPER_PRECISIONS
+from weight_cache import load_whisper_model
+from memory_utils import module_footprint, estimate_whisper_footprint, default_budget, release_memory, WHISPER_POOL_FRACTION
+from audio_features import load_pcm, load_mel, SAMPLE_RATE, N_SAMPLES
+from vad import apply_vad
+from long_audio import long_audio_pool, LONG_AUDIO_MIN_SECONDS
+from batching import WhisperBatcher, BATCHING_ENABLED, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS
+from speculative import speculative_decode, can_draft, draft_compatible, whisper_draft_model
+from language_id import to_language_code
+from device import get_device
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Memory budget for resident Whisper models (default: 40% of RAM, or VRAM on CUDA)
+MODEL_POOL_MAX_BYTES = int(os.environ.get("MODEL_POOL_MAX_BYTES", "0")) or None
+
 class ModelPool:
-    def __init__(self, max_models=3):
+    def __init__(self, max_bytes=None):
         self.models = {}
         self.last_used = {}
-        self.max_models = max_models
-        self.lock = Lock()
+        self.footprints = {}  # key -> bytes of parameters and buffers
+        self.loading = {}  # key -> Future for loads in flight
+        self.inference_locks = {}  # key -> Lock held around every decode on that model
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.lock = Lock()  # Guards the dicts only, never held during a load
   
-    def get_model(self, model_size):
+    def get_model(self, model_size, precision="auto"):
         # Map 'turbo' to 'large-v3-turbo' for consistency with newer releases
         if model_size.lower() == "turbo":
             model_size = "large-v3-turbo"
             
-        with self.lock:
-            device = get_device()
-            key = f"{model_size}_{device}"
-            
+        device = get_device()
+        check_precision(precision, device, WHISPER_PRECISIONS)
+        key = self.pool_key(model_size, precision)
+
+        with timed_lock(self.lock, "whisper"):
             if key in self.models:
                 self.last_used[key] = time.time()
+                POOL_REQUESTS_TOTAL.inc(pool="whisper", result="hit")
                 return self.models[key]
+
+            # Join a load already in flight for this key, or start one
+            future = self.loading.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.loading[key] = future
+        POOL_REQUESTS_TOTAL.inc(pool="whisper", result="miss" if owner else "wait")
+
+        if not owner:
+            logger.info(f"Waiting for in-flight load of Whisper {model_size}")
+            return future.result()
+
+        try:
+            # Make room up front so the load itself does not overshoot the budget
+            self._evict_for(estimate_whisper_footprint(model_size), device)
+
             logger.info(f"Loading Whisper {model_size} model on {device}...")
-            
-            model = whisper.load_model(model_size, device=device)
-                
-            
-            # Remove oldest model if pool is full
-            if len(self.models) >= self.max_models:
+            with MODEL_LOAD_SECONDS.time(pool="whisper", model=key):
+                # Memory-mapped from the converted-weight cache after the first load
+                model = load_whisper_model(model_size, device, precision)
+
+            footprint = module_footprint(model)
+            logger.info(f"Whisper {model_size} ({precision}) uses {footprint / 1024**2:.1f} MB")
+            self._evict_for(footprint, device)
+
+            with self.lock:
+                self.models[key] = model
+                self.footprints[key] = footprint
+                self.last_used[key] = time.time()
+        except BaseException as e:
+            # Waiters must never hang on a load that will not finish
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.loading.pop(key, None)
+
+        future.set_result(model)
+        return model
+
+    def pool_key(self, model_size, precision="auto"):
+        """Pool key of a model; each precision is its own entry and "auto" keeps the original key"""
+        if model_size.lower() == "turbo":
+            model_size = "large-v3-turbo"
+        device = get_device()
+        return f"{model_size}_{device}" if precision == "auto" else f"{model_size}_{device}_{precision}"
+
+    def is_loaded(self, model_size, precision="auto"):
+        """Whether get_model would return without loading"""
+        key = self.pool_key(model_size, precision)
+        with self.lock:
+            return key in self.models
+
+    def inference_lock(self, model_size, precision="auto"):
+        """
+        Lock to hold around every transcribe, decode or detect_language call on a pooled model.
+
+        whisper installs its kv-cache hooks on the shared model for the length of a decode,
+        so two decodes on the same model at once corrupt each other's caches.
+        """
+        key = self.pool_key(model_size, precision)
+        with self.lock:
+            return self.inference_locks.setdefault(key, Lock())
+
+    def used_bytes(self):
+        with self.lock:
+            return sum(self.footprints.values())
+
+    def _evict_for(self, needed, device):
+        """Evict least recently used models until needed bytes fit in the budget"""
+        budget = self.max_bytes or default_budget(device, WHISPER_POOL_FRACTION)
+        evicted = False
+        with self.lock:
+            while self.models and sum(self.footprints.values()) + needed > budget:
                 oldest_key = min(self.last_used.items(), key=lambda x: x[1])[0]
                 logger.info(f"Removing oldest model {oldest_key} from pool")
                 del self.models[oldest_key]
                 del self.last_used[oldest_key]
-            
-            self.models[key] = model
-            self.last_used[key] = time.time()
-            
-            return model
+                del self.footprints[oldest_key]
+                self.evictions += 1
+                POOL_EVICTIONS_TOTAL.inc(pool="whisper")
+                evicted = True
+        if evicted:
+            release_memory()
+
+    def stats(self):
+        """Pool occupancy for the /api/models endpoint"""
+        with self.lock:
+            return {
+                "max_bytes": self.max_bytes or default_budget(get_device(), WHISPER_POOL_FRACTION),
+                "used_bytes": sum(self.footprints.values()),
+                "models": {key: {"bytes": self.footprints[key], "last_used": self.last_used[key]} for key in self.models},
+                "loading": list(self.loading),
+                "evictions": self.evictions,
+            }
 
 # Tạo global model pool
-model_pool = ModelPool(max_models=3)
+model_pool = ModelPool(max_bytes=MODEL_POOL_MAX_BYTES)
+
+# Cross-request batching for short clips
+whisper_batcher = WhisperBatcher(model_pool, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
 
 # Global variable to store the loaded models
 models = {}
 
-def get_device():
-    """Determine the appropriate device (CUDA GPU or CPU) for running Whisper."""
-    cuda_available = torch.cuda.is_available()
-    logger.info(f"CUDA available: {cuda_available}")
-    
-    if cuda_available:
-        logger.info(f"GPU device: {torch.cuda.get_device_name(0)}")
-        logger.info(f"GPU device count: {torch.cuda.device_count()}")
-        device = "cuda"
-    else:
-        logger.info("No CUDA device available. Using CPU instead.")
-        device = "cpu"
-        
-    return device
-
 def get_model(model_size="base"):
     """
     Get or load the Whisper model of the specified size.
@@ -76,6 +163,9 @@ def get_model(model_size="base"):
     Returns:
         The loaded Whisper model
     """
+    import torch
+    import whisper
+
     # Map 'turbo' to 'large-v3-turbo' for consistency with newer releases
     if model_size.lower() == "turbo":
         model_size = "large-v3-turbo"
@@ -166,40 +256,110 @@ def transcribe_audio(audio_path, language="tiếng việt", model_size="base"):
         logger.error(f"Transcription error: {str(e)}")
         raise
         
-def transcribe_with_pool(audio_path, language="tiếng việt", model_size="base"):
-    """Transcribe sử dụng model pool"""
+def transcribe_with_pool(audio_path, language="tiếng việt", model_size="base", use_vad=False, long_audio=False, precision="auto", return_segments=False, assisted=False, timings=None):
+    """Transcribe sử dụng model pool (use_vad: chỉ giải mã các đoạn có tiếng nói, long_audio: chia file dài cho nhiều process, return_segments: trả về (text, segments) có timestamp, assisted: model nhỏ đoán trước token cho model lớn kiểm tra, timings: dict nhận "inference" = số giây giải mã, không tính thời gian load model)"""
     try:
-
-        model = model_pool.get_model(model_size)
-            
         logger.info(f"Model used: {model_size}")
 
-        # Map UI language choices to Whisper language codes
-        language_map = {
-            "english": "en",
-            "tiếng việt": "vi"
-        }
+        # Map UI language choices to Whisper language codes (detected codes pass through)
         audio_path = os.path.abspath(audio_path)
-        language_code = language_map.get(language.lower(), "vi")
+        language_code = to_language_code(language)
 
         # Log transcription start
         logger.info(f"Starting transcription for {audio_path} in {language_code}")
-        # Set transcription options
-        transcribe_options = {
-            "language": language_code,
-            "task": "transcribe",
-        }
+        labels = {"backend": "whisper", "model": model_size, "language": language_code}
+        total_start = time.perf_counter()
 
-        # Perform transcription
-        result = model.transcribe(audio_path, **transcribe_options)
+        # Use the PCM decoded at upload time (falls back to ffmpeg for older sessions)
+        with TRANSCRIPTION_STAGE_SECONDS.time(stage="load_audio", **labels):
+            audio = load_pcm(audio_path)
+        mel = None
 
-        # Extract and return the transcribed text
-        transcription = result["text"]
+        if use_vad:
+            # Drop silence before decoding (the cached mel no longer matches the audio)
+            with TRANSCRIPTION_STAGE_SECONDS.time(stage="vad", **labels):
+                audio, speech_map = apply_vad(audio)
+            if len(audio) == 0:
+                logger.info("No speech detected, skipping decode")
+                return ("", []) if return_segments else ""
+
+        if long_audio and len(audio) >= LONG_AUDIO_MIN_SECONDS * SAMPLE_RATE:
+            # Fan ~30 s chunks out to worker processes that each hold their own model
+            whisper_name = "large-v3-turbo" if model_size.lower() == "turbo" else model_size
+            inference_start = time.perf_counter()
+            with TRANSCRIPTION_STAGE_SECONDS.time(stage="inference", **labels):
+                transcription, segments = long_audio_pool.transcribe(audio, whisper_name, language_code, precision)
+            if timings is not None:
+                timings["inference"] = time.perf_counter() - inference_start
+            TRANSCRIPTION_STAGE_SECONDS.observe(time.perf_counter() - total_start, stage="total", **labels)
+            logger.info(f"Transcription complete: {len(transcription)} characters")
+            if use_vad:
+                speech_map.remap_segments(segments)
+            return (transcription, segments) if return_segments else transcription
+
+        with TRANSCRIPTION_STAGE_SECONDS.time(stage="get_model", **labels):
+            model = model_pool.get_model(model_size, precision)
+        if not use_vad and len(audio) <= N_SAMPLES:
+            mel = load_mel(audio_path, model.dims.n_mels)
+
+        draft = None
+        draft_size = whisper_draft_model(model_size)
+        if assisted and draft_compatible(model_size, draft_size) is False:
+            # No draft, or a known mismatch: do not load (and possibly evict for) one that cannot be used
+            logger.warning(f"No draft model can assist {model_size} (draft: {draft_size}), decoding normally")
+        elif assisted and model_pool.pool_key(draft_size, precision) == model_pool.pool_key(model_size, precision):
+            # A model cannot usefully draft for itself (and would take its own inference lock twice)
+            logger.info(f"{model_size} is the draft model, decoding normally")
+        elif assisted and len(audio) <= N_SAMPLES:
+            # The draft model lives in the same pool (and budget) as the model it assists
+            with TRANSCRIPTION_STAGE_SECONDS.time(stage="get_draft_model", **labels):
+                draft = model_pool.get_model(draft_size, precision)
+            if not can_draft(model, draft):
+                logger.warning(f"Draft model {draft_size} cannot assist {model_size} (different tokenizer or mel bins), decoding normally")
+                draft = None
+
+        inference_start = time.perf_counter()
+        if draft is not None:
+            import whisper
+            if mel is None:
+                mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=model.dims.n_mels)
+            # Main model first: drafts are always smaller than the models they assist, so this order cannot deadlock
+            with model_pool.inference_lock(model_size, precision), model_pool.inference_lock(draft_size, precision):
+                transcription = speculative_decode(model, draft, mel, language_code)
+            segments = [{"start": 0.0, "end": round(len(audio) / SAMPLE_RATE, 2), "text": transcription}] if transcription else []
+        elif BATCHING_ENABLED and len(audio) <= N_SAMPLES:
+            # Clip fits in one 30-second window: batch it with concurrent requests
+            transcription, segments = whisper_batcher.transcribe(audio, model_size, language_code, mel=mel, precision=precision)
+        else:
+            # Set transcription options
+            transcribe_options = {
+                "language": language_code,
+                "task": "transcribe",
+                "fp16": model.device.type == "cuda" and precision == "auto",
+            }
+
+            # Perform transcription
+            with model_pool.inference_lock(model_size, precision):
+                result = model.transcribe(audio, **transcribe_options)
+
+            # Extract and return the transcribed text
+            transcription = result["text"]
+            segments = [
+                {"start": round(seg["start"], 2), "end": round(seg["end"], 2), "text": seg["text"].strip()}
+                for seg in result["segments"]
+            ]
+        TRANSCRIPTION_STAGE_SECONDS.observe(time.perf_counter() - inference_start, stage="inference", **labels)
+        if timings is not None:
+            timings["inference"] = time.perf_counter() - inference_start
+        TRANSCRIPTION_STAGE_SECONDS.observe(time.perf_counter() - total_start, stage="total", **labels)
 
         # Log successful transcription
         logger.info(f"Transcription complete: {len(transcription)} characters")
 
-        return transcription
+        if use_vad:
+            # Report times on the original recording, not the silence-stripped audio
+            speech_map.remap_segments(segments)
+        return (transcription, segments) if return_segments else transcription
     
     except Exception as e:
         logger.error(f"Transcription error: {str(e)}")
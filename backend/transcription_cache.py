@@ -0,0 +1,184 @@
+import os
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cache limits, overridable from the environment
+CACHE_MEMORY_ENTRIES = int(os.environ.get("TRANSCRIPTION_CACHE_MEMORY_ENTRIES", "512"))
+CACHE_DISK_BYTES = int(os.environ.get("TRANSCRIPTION_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+# Disk eviction trims to this fraction of the limit, so the directory scan it needs is rare
+CACHE_DISK_TRIM_FRACTION = 0.9
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_hash_sidecar(path, digest):
+    """Record an already-computed content hash next to a file"""
+    with open(f"{path}.sha256", "w", encoding="utf-8") as f:
+        f.write(digest)
+
+
+def audio_hash(path):
+    """Content hash of an audio file, from the upload-time sidecar when it is current"""
+    sidecar = f"{path}.sha256"
+    try:
+        if os.path.getmtime(sidecar) >= os.path.getmtime(path):
+            with open(sidecar, "r", encoding="utf-8") as f:
+                return f.read().strip()
+    except OSError:
+        pass
+    return hash_file(path)
+
+
+def make_cache_key(audio_hash, backend, model, language, **options):
+    """Build the cache key from the audio hash and everything that affects the output"""
+    raw = f"{audio_hash}|{backend}|{model.lower()}|{language.lower()}"
+    # Only non-default options are appended, so existing keys stay valid
+    for name, value in sorted(options.items()):
+        if value:
+            raw += f"|{name}={value}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TranscriptionCache:
+    """
+    Two-tier transcription cache: an in-memory LRU in front of JSON files on disk.
+    Disk entries are evicted oldest-access-first once the directory exceeds max_disk_bytes.
+    The directory is scanned on the first write and when the limit is crossed; in between,
+    its size is tracked from this process's writes.
+    """
+
+    def __init__(self, cache_dir, max_memory_entries=512, max_disk_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self.evictions = 0
+        self.disk_bytes = None  # bytes of entries on disk, None until the first scan
+        self.lock = Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Return the cached entry for key, or None on a miss"""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return self.memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            # Touch the file so disk eviction follows access order
+            os.utime(path)
+        except (OSError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits["disk"] += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        """Store an entry (a JSON-serializable dict) in both tiers"""
+        with self.lock:
+            self._remember(key, entry)
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        try:
+            old_size = os.path.getsize(path)
+        except OSError:
+            old_size = 0
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            new_size = os.path.getsize(path)
+        except OSError as e:
+            logger.error(f"Error writing cache entry {key}: {str(e)}")
+            return
+
+        with self.lock:
+            if self.disk_bytes is not None:
+                self.disk_bytes += new_size - old_size
+            over = self.disk_bytes is None or self.disk_bytes > self.max_disk_bytes
+        if over:
+            self._evict_disk()
+
+    def _remember(self, key, entry):
+        # Called with lock held
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def _evict_disk(self):
+        # Rescan to pick up writes from other processes sharing the directory
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        if total <= self.max_disk_bytes:
+            with self.lock:
+                self.disk_bytes = total
+            return
+        target = int(self.max_disk_bytes * CACHE_DISK_TRIM_FRACTION)
+        files.sort()
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self.lock:
+                self.evictions += 1
+                self.memory.pop(os.path.basename(path)[:-len(".json")], None)
+        with self.lock:
+            self.disk_bytes = total
+        logger.info(f"Transcription cache trimmed to {total} bytes on disk")
+
+    def stats(self):
+        with self.lock:
+            return {
+                "memory_entries": len(self.memory),
+                "memory_hits": self.hits["memory"],
+                "disk_hits": self.hits["disk"],
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_bytes": self.disk_bytes,
+            }
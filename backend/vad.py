@@ -0,0 +1,144 @@
+import os
+import bisect
+import logging
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+# Detector settings, overridable from the environment
+VAD_FRAME_MS = int(os.environ.get("VAD_FRAME_MS", "30"))
+VAD_MARGIN_DB = float(os.environ.get("VAD_MARGIN_DB", "10"))
+VAD_MIN_SPEECH_MS = int(os.environ.get("VAD_MIN_SPEECH_MS", "250"))
+VAD_MIN_SILENCE_MS = int(os.environ.get("VAD_MIN_SILENCE_MS", "500"))
+VAD_PAD_MS = int(os.environ.get("VAD_PAD_MS", "200"))
+VAD_GAP_MS = 100  # silence inserted between kept regions so words do not run together
+
+
+def frame_features(audio, frame_len):
+    """Per-frame log energy (dB) and spectral flatness for non-overlapping frames"""
+    n_frames = len(audio) // frame_len
+    frames = np.asarray(audio[:n_frames * frame_len], dtype=np.float32).reshape(n_frames, frame_len)
+
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(frame_len), axis=1)) + 1e-10
+    flatness = np.exp(np.mean(np.log(spectrum), axis=1)) / np.mean(spectrum, axis=1)
+    return energy_db, flatness
+
+
+def detect_speech(audio, sample_rate=SAMPLE_RATE):
+    """
+    Find speech regions with an adaptive energy threshold and a spectral flatness check.
+
+    Args:
+        audio: Mono float32 samples
+        sample_rate: Sample rate of audio
+
+    Returns:
+        List of (start_sample, end_sample) speech regions in order
+    """
+    frame_len = int(sample_rate * VAD_FRAME_MS / 1000)
+    if len(audio) < frame_len:
+        return []
+
+    energy_db, flatness = frame_features(audio, frame_len)
+    # Track the noise floor from the quietest frames, but never call digital silence speech
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(noise_floor + VAD_MARGIN_DB, -55.0)
+    # Speech is loud and tonal; broadband noise has a flat spectrum
+    is_speech = (energy_db > threshold) & (flatness < 0.5)
+
+    # Collect runs of speech frames
+    regions = []
+    start = None
+    for i, flag in enumerate(is_speech):
+        if flag and start is None:
+            start = i
+        elif not flag and start is not None:
+            regions.append([start, i])
+            start = None
+    if start is not None:
+        regions.append([start, len(is_speech)])
+
+    # Bridge short pauses, then drop blips too short to be words
+    min_silence = VAD_MIN_SILENCE_MS // VAD_FRAME_MS
+    merged = []
+    for region in regions:
+        if merged and region[0] - merged[-1][1] < min_silence:
+            merged[-1][1] = region[1]
+        else:
+            merged.append(region)
+    min_speech = VAD_MIN_SPEECH_MS // VAD_FRAME_MS
+    merged = [r for r in merged if r[1] - r[0] >= min_speech]
+
+    # Pad each region and convert frames to samples
+    pad = int(sample_rate * VAD_PAD_MS / 1000)
+    result = []
+    for start, end in merged:
+        s = max(0, start * frame_len - pad)
+        e = min(len(audio), end * frame_len + pad)
+        if result and s <= result[-1][1]:
+            result[-1] = (result[-1][0], e)
+        else:
+            result.append((s, e))
+    return result
+
+
+class SpeechMap:
+    """Maps times in the speech-only audio back to times in the original recording"""
+
+    def __init__(self, regions, sample_rate=SAMPLE_RATE):
+        self.compact_starts = []
+        self.original_starts = []
+        self.durations = []
+        gap = VAD_GAP_MS / 1000
+        position = 0.0
+        for start, end in regions:
+            duration = (end - start) / sample_rate
+            self.compact_starts.append(position)
+            self.original_starts.append(start / sample_rate)
+            self.durations.append(duration)
+            position += duration + gap
+
+    def to_original(self, t):
+        """Convert a time (seconds) in the compacted audio to the original timeline"""
+        if not self.compact_starts:
+            return t
+        i = max(0, bisect.bisect_right(self.compact_starts, t) - 1)
+        offset = min(max(t - self.compact_starts[i], 0.0), self.durations[i])
+        return self.original_starts[i] + offset
+
+    def remap_segments(self, segments):
+        """Rewrite the start/end of Whisper-style segment dicts in place"""
+        for seg in segments:
+            seg["start"] = round(self.to_original(seg["start"]), 2)
+            seg["end"] = round(self.to_original(seg["end"]), 2)
+        return segments
+
+
+def apply_vad(audio, sample_rate=SAMPLE_RATE):
+    """
+    Keep only the speech in a recording.
+
+    Args:
+        audio: Mono float32 samples
+        sample_rate: Sample rate of audio
+
+    Returns:
+        Tuple of (speech-only audio, SpeechMap back to the original timeline)
+    """
+    regions = detect_speech(audio, sample_rate)
+    gap = np.zeros(int(sample_rate * VAD_GAP_MS / 1000), dtype=np.float32)
+    pieces = []
+    for start, end in regions:
+        pieces.append(np.asarray(audio[start:end], dtype=np.float32))
+        pieces.append(gap)
+    speech = np.concatenate(pieces[:-1]) if pieces else np.zeros(0, dtype=np.float32)
+
+    kept = len(speech) / max(len(audio), 1)
+    logger.info(f"VAD kept {len(regions)} speech regions ({kept:.0%} of the audio)")
+    return speech, SpeechMap(regions, sample_rate)
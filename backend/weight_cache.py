@@ -0,0 +1,216 @@
+import os
+import json
+import shutil
+import logging
+import tempfile
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Converted-weight cache settings, overridable from the environment
+WEIGHT_CACHE_ENABLED = os.environ.get("WEIGHT_CACHE", "1") == "1"
+WEIGHT_CACHE_DIR = os.environ.get(
+    "WEIGHT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "storage", "_weights"),
+)
+
+# Bump when the on-disk layout changes so stale entries are rebuilt
+WEIGHT_CACHE_VERSION = 1
+
+
+def whisper_cache_path(model_size, precision="auto"):
+    # int8 packs weights into quantized modules that cannot be memory-mapped,
+    # so every precision is cached as fp32 and int8 is quantized after the (fast) load
+    return os.path.join(WEIGHT_CACHE_DIR, "whisper", f"{model_size}-fp32.pt")
+
+
+def _save_whisper(model, path):
+    """Store the converted weights and every buffer (non-persistent ones included) with the model dims"""
+    import torch
+
+    state = dict(model.state_dict())
+    buffers = {}
+    for name, value in model.named_buffers():
+        if name in state:
+            continue
+        # Sparse buffers (alignment_heads) are stored dense so the file loads with weights_only
+        if value.is_sparse:
+            buffers[f"__sparse_buffer__.{name}"] = value.to_dense()
+        else:
+            buffers[f"__buffer__.{name}"] = value
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Each writer gets its own temp file: long-audio workers may convert the same model at once
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        torch.save({
+            "version": WEIGHT_CACHE_VERSION,
+            "dims": vars(model.dims),
+            "state": {**state, **buffers},
+        }, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    logger.info(f"Cached converted weights at {path}")
+
+
+def _load_whisper(path):
+    """Rebuild a Whisper model whose tensors are memory-mapped from the cache file"""
+    import torch
+    from whisper.model import ModelDimensions, Whisper
+
+    checkpoint = torch.load(path, mmap=True, weights_only=True, map_location="cpu")
+    if checkpoint.get("version") != WEIGHT_CACHE_VERSION:
+        raise ValueError("stale weight cache entry")
+
+    dims = ModelDimensions(**checkpoint["dims"])
+    try:
+        # Build on the meta device so no memory is allocated or initialized for weights that get replaced
+        with torch.device("meta"):
+            model = Whisper(dims)
+    except (NotImplementedError, RuntimeError):
+        model = Whisper(dims)
+    state, buffers = {}, {}
+    for name, value in checkpoint["state"].items():
+        if name.startswith("__buffer__."):
+            buffers[name[len("__buffer__."):]] = value
+        elif name.startswith("__sparse_buffer__."):
+            buffers[name[len("__sparse_buffer__."):]] = value.to_sparse()
+        else:
+            state[name] = value
+    model.load_state_dict(state, assign=True)
+    for name, value in buffers.items():
+        module_name, _, buffer_name = name.rpartition(".")
+        model.get_submodule(module_name)._buffers[buffer_name] = value
+    return model.eval()
+
+
+def load_whisper_model(model_size, device="cpu", precision="auto"):
+    """
+    Load an openai-whisper model in the requested precision, through the converted-weight cache.
+
+    The first load downloads and converts the checkpoint as usual and stores the result;
+    later loads (after a restart or a pool eviction) memory-map it, need no network and do
+    no dtype conversion.
+
+    Args:
+        model_size: Whisper model name (as passed to whisper.load_model)
+        device: Device to place the model on
+        precision: "auto", "fp32" or "int8"
+
+    Returns:
+        The loaded model
+    """
+    import whisper
+    from precision import apply_whisper_precision
+
+    path = whisper_cache_path(model_size, precision)
+    model = None
+    if WEIGHT_CACHE_ENABLED and os.path.exists(path):
+        try:
+            model = _load_whisper(path)
+            logger.info(f"Loaded {model_size} from weight cache {path}")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable weight cache {path}: {str(e)}")
+
+    if model is None:
+        model = whisper.load_model(model_size, device="cpu")
+        if WEIGHT_CACHE_ENABLED:
+            try:
+                _save_whisper(model, path)
+            except Exception as e:
+                logger.warning(f"Could not cache weights for {model_size}: {str(e)}")
+
+    if precision == "int8":
+        model = apply_whisper_precision(model, "int8")
+    return model.to(device)
+
+
+def hf_cache_path(model_id, torch_dtype, decoder_only=False):
+    dtype_name = str(torch_dtype).replace("torch.", "")
+    suffix = "-decoder" if decoder_only else ""
+    return os.path.join(WEIGHT_CACHE_DIR, "hf", f"{model_id.replace('/', '--')}-{dtype_name}{suffix}")
+
+
+def _publish_dir(tmp_path, path):
+    """Move a complete cache directory into place; if another writer got there first, keep theirs"""
+    try:
+        os.rename(tmp_path, path)
+        return
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(path, "weight_cache.json"), "r", encoding="utf-8") as f:
+            if json.load(f).get("version") == WEIGHT_CACHE_VERSION:
+                return
+    except (OSError, ValueError):
+        pass
+    # A stale entry, or a partial one without a marker: replace it
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        pass
+
+
+def load_hf_model(model_id, torch_dtype, with_processor=True, decoder_only=False):
+    """
+    Load a HuggingFace speech seq2seq model (and its processor) through the converted-weight cache.
+
+    decoder_only loads just the decoder (WhisperForCausalLM), for draft models that
+    reuse the encoder output of the model they assist.
+
+    Weights are stored as safetensors already in torch_dtype, so later loads are
+    memory-mapped without conversion and work offline.
+
+    Returns:
+        Tuple of (model, processor or None)
+    """
+    from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, WhisperForCausalLM
+
+    model_class = WhisperForCausalLM if decoder_only else AutoModelForSpeechSeq2Seq
+    path = hf_cache_path(model_id, torch_dtype, decoder_only)
+    marker = os.path.join(path, "weight_cache.json")
+    if WEIGHT_CACHE_ENABLED and os.path.exists(marker):
+        try:
+            model = model_class.from_pretrained(
+                path, torch_dtype=torch_dtype, low_cpu_mem_usage=True, use_safetensors=True, local_files_only=True
+            )
+            processor = AutoProcessor.from_pretrained(path, local_files_only=True) if with_processor else None
+            logger.info(f"Loaded {model_id} from weight cache {path}")
+            return model, processor
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable weight cache {path}: {str(e)}")
+
+    model = model_class.from_pretrained(
+        model_id, torch_dtype=torch_dtype, low_cpu_mem_usage=True, use_safetensors=True
+    )
+    processor = AutoProcessor.from_pretrained(model_id)
+    if WEIGHT_CACHE_ENABLED:
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # A private temp directory per writer, so concurrent writers never share or delete each other's files
+            tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+            model.save_pretrained(tmp_path, safe_serialization=True)
+            processor.save_pretrained(tmp_path)
+            with open(os.path.join(tmp_path, "weight_cache.json"), "w", encoding="utf-8") as f:
+                json.dump({"version": WEIGHT_CACHE_VERSION, "model_id": model_id, "dtype": str(torch_dtype)}, f)
+            _publish_dir(tmp_path, path)
+            logger.info(f"Cached converted weights at {path}")
+        except Exception as e:
+            logger.warning(f"Could not cache weights for {model_id}: {str(e)}")
+        finally:
+            if tmp_path is not None:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+    return model, processor if with_processor else None
+
+
+if __name__ == "__main__":
+    # Pre-build cache entries while online, e.g. python backend/weight_cache.py turbo large-v3
+    import sys
+
+    for name in sys.argv[1:] or ["large-v3-turbo"]:
+        load_whisper_model("large-v3-turbo" if name == "turbo" else name)
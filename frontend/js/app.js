@@ -101,16 +101,15 @@ document.addEventListener('DOMContentLoaded', () => {
             spinner.classList.remove('hidden');
             statusMessage.textContent = 'Uploading audio...';
             
-            // Create form data
-            const formData = new FormData();
-            formData.append('file', audioBlob, 'audio.webm');
-            formData.append('language', languageSelect.value);
-          
-            // Upload the audio file
+            // Upload the audio file as a raw body so the server can decode it while it streams in
             const startTime = new Date().getTime();
-            const response = await fetch('http://localhost:8000/api/upload-audio', {
+            const uploadUrl = `http://localhost:8000/api/upload-audio-stream?language=${encodeURIComponent(languageSelect.value)}`;
+            const response = await fetch(uploadUrl, {
                 method: 'POST',
-                body: formData,
+                headers: {
+                    'Content-Type': 'audio/webm',
+                },
+                body: audioBlob,
             });
            
             if (!response.ok) {
@@ -150,6 +149,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify({
+                    session_id: sessionInfo.session_id,
                     date_folder: sessionInfo.date_folder,
                     session_folder: sessionInfo.session_folder,
                     language: sessionInfo.language,